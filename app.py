@@ -3,15 +3,34 @@ import boto3
 import requests
 import base64
 import time
+import logging
+import http.cookiejar
 import os
 import re
-import ast
 import json
+import gzip
+import hashlib
+import threading
+import uuid
+import sys
+import wave
+import zipfile
+import difflib
+import functools
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from io import BytesIO
+from report_model import REPORT_FIELDS, REPORT_FIELD_LABELS, Report, loads_json, clean_llm_response
 
 # === Config (replace with your actual values) ===
 REGION = st.secrets["REGION"]
@@ -19,8 +38,274 @@ USER_POOL_ID = st.secrets["USER_POOL_ID"]
 CLIENT_ID = st.secrets["CLIENT_ID"]
 API_URL = st.secrets["API_URL"]
 
+# === Optional transport settings ===
+# "gzip", "zstd" or "none"; only enable once the backend accepts compressed request bodies.
+# zstd needs the `zstandard` package and falls back to gzip without it
+REQUEST_COMPRESSION = st.secrets.get("REQUEST_COMPRESSION", "none")
+# Store each transcript once on the backend and send only a reference to the summary endpoints
+USE_TRANSCRIPT_REFS = st.secrets.get("USE_TRANSCRIPT_REFS", False)
+# Payloads smaller than this are not worth compressing
+COMPRESSION_MIN_BYTES = 1024
+# Upper bound on rendered PDF bytes kept in memory
+PDF_CACHE_MAX_BYTES = st.secrets.get("PDF_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+# Transcript segments shown per page in the transcript editor
+SEGMENTS_PER_PAGE = 20
+# Target size of segments when the backend returns only flat text
+FALLBACK_SEGMENT_CHARS = 600
+# On-disk queue for uploads and summary requests that failed while offline
+OUTBOX_DIR = st.secrets.get("OUTBOX_DIR", ".outbox")
+OUTBOX_FLUSH_INTERVAL = 10  # seconds between background flush passes
+OUTBOX_BATCH_SIZE = 5
+OUTBOX_MAX_BACKOFF = 300  # seconds
+# Opt-in: recordings longer than SPLIT_MIN_SECONDS are cut near every SPLIT_TARGET_SECONDS at the quietest point
+SPLIT_LONG_AUDIO = st.secrets.get("SPLIT_LONG_AUDIO", False)
+SPLIT_MIN_SECONDS = 600
+SPLIT_TARGET_SECONDS = 300
+SPLIT_SEARCH_SECONDS = 30
+SILENCE_WINDOW_SECONDS = 0.1
+# Wait for transcription completion on the backend's server-sent event stream; polling is the fallback
+PUSH_COMPLETION = st.secrets.get("PUSH_COMPLETION", True)
+# The backend sends keep-alive comments; a longer silence means the stream is dead
+SSE_IDLE_TIMEOUT = 60
+# Show a fast draft transcript and reports first while an accurate pass runs in the background
+TWO_PASS_TRANSCRIPTION = st.secrets.get("TWO_PASS_TRANSCRIPTION", False)
+# Visits processed concurrently in the background, and how often the queue dashboard refreshes
+VISIT_WORKERS = 4
+VISIT_REFRESH_SECONDS = 5
+# Opt-in rerun profiling (also enabled per session with ?profile=1); the report page is admin-only
+PROFILE_RERUNS = st.secrets.get("PROFILE_RERUNS", False)
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_HISTORY = 200  # reruns kept in memory
+PROFILE_MAX_SECONDS = 300  # a profile still open after this long is closed by its sampler
+ADMIN_GROUP = st.secrets.get("ADMIN_GROUP", "admin")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    # Optional: decodes MP3/M4A (needs ffmpeg) so they can be split like WAV
+    from pydub import AudioSegment
+except ImportError:
+    AudioSegment = None
+
+# Chunk size used when streaming audio to S3 (lets a speculative upload be cancelled mid-way)
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+
+class RejectAllCookies(http.cookiejar.DefaultCookiePolicy):
+    """Cookie policy that refuses every cookie, so the shared session cannot carry state between users."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+@st.cache_resource
+def get_http_session():
+    """Shared keep-alive connection pool for the backend and S3."""
+    session = requests.Session()
+    # Shared by every doctor's session: never keep cookies from the backend or S3
+    session.cookies.set_policy(RejectAllCookies())
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+HTTP = get_http_session()
+
+# === Token Claims ===
+def token_claims(token):
+    """Unverified JWT payload; only used to route local state, never for authorization by the backend."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (AttributeError, IndexError, ValueError):
+        return {}
+
+
+def token_subject(token):
+    """Cognito `sub` claim of a JWT, used to keep each doctor's outbox entries separate."""
+    return token_claims(token).get("sub")
+
+
+def is_admin(token):
+    """Whether the logged-in doctor belongs to the Cognito admin group."""
+    return ADMIN_GROUP in token_claims(token).get("cognito:groups", [])
+
+
+# === Rerun Profiler ===
+@st.cache_resource
+def get_tracemalloc_state():
+    """Process-wide count of profiles using tracemalloc; tracing is shared by every session."""
+    return {"users": 0, "owned": False, "lock": threading.Lock()}
+
+
+def acquire_tracemalloc():
+    state = get_tracemalloc_state()
+    with state["lock"]:
+        if state["users"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            state["owned"] = True
+        state["users"] += 1
+
+
+def release_tracemalloc():
+    """Stop tracing when the last profile finishes, unless something else started it."""
+    state = get_tracemalloc_state()
+    with state["lock"]:
+        state["users"] -= 1
+        if state["users"] == 0 and state["owned"]:
+            tracemalloc.stop()
+            state["owned"] = False
+
+
+def profiling_enabled():
+    """PROFILE_RERUNS turns profiling on for everyone; ?profile=1 only works for admins."""
+    return PROFILE_RERUNS or (st.query_params.get("profile") == "1" and is_admin(st.session_state.get("jwt_token")))
+
+
+class RerunProfile:
+    """Timings, stack samples and allocation counts for one execution of the script."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.time()
+        self.sections = []  # (name, seconds, depth)
+        self.stacks = Counter()
+        self.allocations = []
+        self.total = None
+        self.interrupted = False
+        self._depth = 0
+        self._lap_name = None
+        self._lap_start = None
+        self._start = time.perf_counter()
+        self._thread = threading.current_thread()
+        self._thread_id = self._thread.ident
+        self._stop = threading.Event()
+        self._finish_lock = threading.Lock()
+        acquire_tracemalloc()
+        self._snapshot = tracemalloc.take_snapshot()
+        threading.Thread(target=self._sample, name="rerun-profiler", daemon=True).start()
+
+    def _sample(self):
+        deadline = self._start + PROFILE_MAX_SECONDS
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            if not self._thread.is_alive() or time.perf_counter() > deadline:
+                # The run raised or its session went away without reaching finish()
+                self.finish(interrupted=True)
+                return
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def mark(self, name):
+        """Close the current top-level section and start the next one."""
+        now = time.perf_counter()
+        if self._lap_name is not None:
+            self.sections.append((self._lap_name, now - self._lap_start, 0))
+        self._lap_name, self._lap_start = name, now
+
+    @contextmanager
+    def section(self, name):
+        if threading.get_ident() != self._thread_id:
+            yield
+            return
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.sections.append((name, time.perf_counter() - start, self._depth + 1))
+
+    def finish(self, interrupted=False):
+        with self._finish_lock:
+            if self.total is not None:
+                return
+            self._finish(interrupted)
+
+    def _finish(self, interrupted):
+        self.mark(None)
+        self._stop.set()
+        self.total = time.perf_counter() - self._start
+        self.interrupted = interrupted
+        stats = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+        self.allocations = [
+            {"location": str(stat.traceback), "blocks": stat.count_diff, "bytes": stat.size_diff}
+            for stat in sorted(stats, key=lambda stat: stat.count_diff, reverse=True)[:15]
+        ]
+        self._snapshot = None
+        release_tracemalloc()
+        get_profile_store().append(self)
+
+
+class ProfileStore:
+    """Recent rerun profiles shared across sessions."""
+
+    def __init__(self, size):
+        self._profiles = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def slowest(self, count=20):
+        with self._lock:
+            profiles = list(self._profiles)
+        return sorted(profiles, key=lambda profile: profile.total, reverse=True)[:count]
+
+
+@st.cache_resource
+def get_profile_store():
+    return ProfileStore(PROFILE_HISTORY)
+
+
+def start_rerun_profile():
+    """Begin profiling this rerun if enabled; finishes a previous profile cut short by st.rerun()."""
+    previous = st.session_state.get("rerun_profile")
+    if previous is not None and previous.total is None:
+        previous.finish(interrupted=True)
+    st.session_state.rerun_profile = None
+
+    if not profiling_enabled():
+        return None
+    profile = RerunProfile(st.session_state.get("current_page", "home"))
+    st.session_state.rerun_profile = profile
+    return profile
+
+
+def profile_mark(name):
+    if PROFILER is not None:
+        PROFILER.mark(name)
+
+
+def profiled(func):
+    """Record the wall time of each call in the active rerun profile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if PROFILER is None:
+            return func(*args, **kwargs)
+        with PROFILER.section(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
 st.set_page_config(layout="wide")
 
+PROFILER = start_rerun_profile()
+profile_mark("global_css")
+
 st.markdown("""
     <style>
         .main .block-container {
@@ -60,6 +345,8 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+logger = logging.getLogger(__name__)
+
 # === Login Function ===
 def login_to_cognito(email, password):
     client = boto3.client('cognito-idp', region_name=REGION)
@@ -93,83 +380,249 @@ def generate_pre_briefing(patient_id, token):
         return {"error": f"Unexpected error: {response.status_code} - {response.text}"}"""
     return "{'response':'Coming Soon'}"
 
-# === Helper Function: Poll for Transcription Result ===
-def send_audio_to_transcription_api(file_bytes, filename, language, token, content_type):
-    """Upload audio to S3 and start transcription."""
+class ApiError(Exception):
+    """Backend request failed; `retryable` marks failures worth retrying later (5xx, throttling)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = status_code is not None and (status_code >= 500 or status_code == 429)
+
+
+# Network failures that leave a request safe to retry from the outbox
+OFFLINE_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+class UploadCancelled(Exception):
+    """A speculative upload was abandoned because its audio was discarded or replaced."""
+
+
+class CancellableBody:
+    """File-like upload body that streams in chunks and aborts once `cancel_event` is set.
+
+    Exposes `__len__` so requests still sends a Content-Length, which presigned S3 PUTs require.
+    """
+
+    def __init__(self, data, cancel_event):
+        self._buffer = BytesIO(data)
+        self._size = len(data)
+        self._cancel_event = cancel_event
+
+    def __len__(self):
+        return self._size
+
+    def read(self, size=-1):
+        if self._cancel_event.is_set():
+            raise UploadCancelled()
+        return self._buffer.read(UPLOAD_CHUNK_BYTES if size is None or size < 0 else size)
+
+
+# === Helper Function: Upload Audio and Start Transcription ===
+def upload_audio(file_bytes, filename, token, content_type, cancel_event=None):
+    """Request a pre-signed URL and upload audio to S3, returning the S3 key. Raises ApiError on failure."""
     # Step 1: Get pre-signed URL
     url = f"{API_URL}/generate-presigned-url"
     headers = {
     "Authorization": f"Bearer {token}",
     "Content-Type": "application/json"
     }
-    presigned_response = requests.post(url, json={"filename": filename, "contentType": content_type}, headers=headers)
+    presigned_response = HTTP.post(url, json={"filename": filename, "contentType": content_type}, headers=headers)
     if presigned_response.status_code != 200:
-        st.error(f"❌ Failed to get upload URL: {presigned_response.status_code} - {presigned_response.text}")
-        return None
+        raise ApiError(f"Failed to get upload URL: {presigned_response.status_code} - {presigned_response.text}", presigned_response.status_code)
 
     upload_data = presigned_response.json()
     upload_url = upload_data["upload_url"]
     s3_key = upload_data["s3_key"]
 
     # Step 2: Upload to S3
-    upload_response = requests.put(upload_url, data=file_bytes, headers={"Content-Type": content_type})
+    body = CancellableBody(file_bytes, cancel_event) if cancel_event is not None else file_bytes
+    upload_response = HTTP.put(upload_url, data=body, headers={"Content-Type": content_type})
 
     if upload_response.status_code not in [200, 204]:
-        st.error(f"❌ Failed to upload file: {upload_response.status_code} - {upload_response.text}")
-        return None
+        raise ApiError(f"Failed to upload file: {upload_response.status_code} - {upload_response.text}", upload_response.status_code)
+
+    return s3_key
+
 
-    # Step 3: Start transcription
+def start_transcription(s3_key, language, token, quality=None):
+    """Start transcription of an uploaded S3 object, returning the job name. Raises ApiError on failure.
+
+    `quality` ("draft" or "accurate") asks the backend for a specific transcription tier.
+    """
+    headers = {
+    "Authorization": f"Bearer {token}",
+    "Content-Type": "application/json"
+    }
     transcription_url = f"{API_URL}/start-transcription-s3"
     transcription_payload = {
         "s3_key": s3_key,
         "language": language
     }
+    if quality:
+        transcription_payload["quality"] = quality
 
-    transcription_response = requests.post(
+    transcription_response = HTTP.post(
         transcription_url,
         headers=headers,
         json=transcription_payload
     )
 
     if transcription_response.status_code != 200:
-        st.error(f"❌ Failed to start transcription: {transcription_response.status_code} - {transcription_response.text}")
-        return None
+        raise ApiError(f"Failed to start transcription: {transcription_response.status_code} - {transcription_response.text}", transcription_response.status_code)
 
     return transcription_response.json().get("job_name")
 
+
+def upload_and_start_transcription(file_bytes, filename, language, token, content_type):
+    """Upload audio to S3 and start transcription, returning the job name. Raises ApiError on failure."""
+    s3_key = upload_audio(file_bytes, filename, token, content_type)
+    return start_transcription(s3_key, language, token)
+
+
+def queue_audio_offline(file_bytes, filename, language, content_type):
+    """Save a recording in the outbox after a connection loss and tell the doctor."""
+    get_outbox().enqueue(
+        "transcription",
+        {"filename": filename, "language": language, "content_type": content_type},
+        blob=file_bytes
+    )
+    st.warning("📮 Connection lost. The recording was saved and will be uploaded automatically once the network is back.")
+
+
+def send_audio_to_transcription_api(file_bytes, filename, language, token, content_type, s3_key=None):
+    """Upload audio to S3 and start transcription; queues the audio in the outbox if the network is down.
+
+    Pass `s3_key` when the audio was already uploaded speculatively to skip straight to starting the job.
+    """
+    try:
+        if s3_key:
+            return start_transcription(s3_key, language, token)
+        return upload_and_start_transcription(file_bytes, filename, language, token, content_type)
+    except OFFLINE_ERRORS:
+        queue_audio_offline(file_bytes, filename, language, content_type)
+    except ApiError as e:
+        st.error(f"❌ {e}")
+    return None
+
 # === Helper Function: Poll for Transcription Result ===
-def poll_transcription_status(job_name, token, max_retries=150, delay=5):
-    """Polls transcription status and returns the text once completed."""
+def check_transcription(job_name, token):
+    """Fetch a job's status once: returns the result data when completed, None while in progress. Raises ApiError."""
     url = f"{API_URL}/get-transcription?job_name={job_name}"
     headers = {"Authorization": f"Bearer {token}"}
+    response = HTTP.get(url, headers=headers)
 
-    for attempt in range(max_retries):
-        response = requests.get(url, headers=headers)
+    if response.status_code == 401:
+        raise ApiError("Unauthorized - check token.", 401)
+    elif response.status_code == 404:
+        raise ApiError("Job not found.", 404)
+    elif response.status_code == 202:
+        return None
+    elif response.status_code != 200:
+        raise ApiError(f"Unexpected error fetching transcription status: {response.status_code} - {response.text}", response.status_code)
 
-        if response.status_code == 401:
-            st.error("❌ Unauthorized - check token.")
-            return None
-        elif response.status_code == 404:
-            st.error(f"❌ Job not found.")
-            return None
-        elif response.status_code == 202:
-            st.write(f"⏳ Transcription still in progress...")
-            time.sleep(delay)
-            continue
-        elif response.status_code != 200:
-            st.error(f"❌ Unexpected error fetching transcription status: {response.status_code} - {response.text}")
-            return None
+    # Success case - 200
+    data = response.json()
+    status = data.get("status")
+
+    if status == "COMPLETED":
+        return data
+    elif status == "FAILED":
+        raise ApiError(f"Transcription job failed: {data.get('error', 'Unknown error')}")
+    return None
+
+
+@st.cache_resource
+def get_push_support():
+    """Remembers whether the backend offers the completion event stream, so a 404 is only paid once."""
+    return {"available": True}
 
-        # Success case - 200
-        data = response.json()
-        status = data.get("status")
 
-        if status == "COMPLETED":
-            return data.get("transcript", "")
-        elif status == "FAILED":
-            st.error(f"❌ Transcription job failed: {data.get('error', 'Unknown error')}")
+def wait_for_completion_event(job_name, token, timeout):
+    """Block on the backend's server-sent events until the job reaches a terminal state.
+
+    Returns True once COMPLETED/FAILED is announced, False on timeout, and None when push is
+    unavailable or the stream drops, in which case the caller falls back to polling.
+    """
+    support = get_push_support()
+    if not PUSH_COMPLETION or not support["available"]:
+        return None
+
+    # A job that already finished never emits another event, so look before subscribing
+    try:
+        if check_transcription(job_name, token) is not None:
+            return True
+    except ApiError:
+        # Failed or unknown job: the caller's status check reports it
+        return True
+    except requests.RequestException:
+        return None
+
+    deadline = time.monotonic() + timeout
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream"}
+    try:
+        with HTTP.get(f"{API_URL}/transcription-events", params={"job_name": job_name}, headers=headers,
+                      stream=True, timeout=(5, SSE_IDLE_TIMEOUT)) as response:
+            if response.status_code in (404, 405, 501):
+                support["available"] = False
+                return None
+            if response.status_code != 200 or not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                return None
+
+            for line in response.iter_lines(decode_unicode=True):
+                if time.monotonic() > deadline:
+                    return False
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[len("data:"):].strip())
+                except ValueError:
+                    continue
+                if event.get("status") in ("COMPLETED", "FAILED"):
+                    return True
+    except requests.RequestException:
+        return None
+    return None
+
+
+def queue_job_offline(job_name):
+    """Keep a running job in the outbox after a connection loss so the doctor can open it later."""
+    outbox = get_outbox()
+    owner = outbox.register_token(st.session_state.jwt_token)
+    if not any(entry["kind"] == "transcription" and (entry["result"] or {}).get("job_name") == job_name
+               for entry in outbox.entries(owner)):
+        outbox.enqueue("transcription", {"job_name": job_name}, result={"job_name": job_name})
+    st.warning("📮 Connection lost. The transcription keeps running; open it from the offline queue once the network is back.")
+
+
+@profiled
+def poll_transcription_status(job_name, token, max_retries=150, delay=5, resume_job=None):
+    """Waits for the completion event (polling as a fallback) and returns the transcript segments once completed.
+
+    If the connection drops, `resume_job` (default: this job) is saved in the outbox and None is returned.
+    """
+    try:
+        return _poll_transcription_status(job_name, token, max_retries, delay)
+    except OFFLINE_ERRORS:
+        queue_job_offline(resume_job or job_name)
+        return None
+
+
+def _poll_transcription_status(job_name, token, max_retries, delay):
+    st.write("⏳ Waiting for transcription to complete...")
+    finished = wait_for_completion_event(job_name, token, max_retries * delay)
+    if finished is False:
+        st.error("❌ Transcription timed out.")
+        return None
+
+    for attempt in range(max_retries):
+        try:
+            data = check_transcription(job_name, token)
+        except ApiError as e:
+            st.error(f"❌ {e}")
             return None
 
+        if data is not None:
+            return parse_transcript_segments(data)
+
         st.write(f"⏳ Waiting for transcription to complete... Retrying in {delay} seconds")
         time.sleep(delay)
 
@@ -177,76 +630,847 @@ def poll_transcription_status(job_name, token, max_retries=150, delay=5):
     return None
 
 
-def clean_llm_response(llm_response):
-    """Extracts and parses the actual response from the LLM, converting it into a clean Python dictionary."""
+def wait_for_transcription(job_name, token, max_retries=150, delay=5):
+    """Background-safe variant of poll_transcription_status: returns segments or raises ApiError."""
+    if wait_for_completion_event(job_name, token, max_retries * delay) is False:
+        raise ApiError("Transcription timed out.")
+
+    for attempt in range(max_retries):
+        data = check_transcription(job_name, token)
+        if data is not None:
+            return parse_transcript_segments(data)
+        time.sleep(delay)
+    raise ApiError("Transcription timed out.")
+
+
+# === Silence-aware Audio Splitting ===
+@dataclass
+class AudioChunk:
+    """A piece of the visit audio; `offset` is its start time in the full recording, in seconds."""
+    offset: float
+    filename: str
+    file_bytes: bytes
+    content_type: str
+
+
+def decode_pcm(file_bytes, content_type):
+    """Decode audio to 16-bit PCM: returns (frames, channels, framerate) or None if it cannot be decoded."""
+    if content_type.endswith("wav"):
+        try:
+            with wave.open(BytesIO(file_bytes)) as wav:
+                if wav.getsampwidth() != 2:
+                    return None
+                return wav.readframes(wav.getnframes()), wav.getnchannels(), wav.getframerate()
+        except (wave.Error, EOFError):
+            return None
+
+    if AudioSegment is None:
+        return None
+    try:
+        segment = AudioSegment.from_file(BytesIO(file_bytes)).set_sample_width(2)
+    except Exception:
+        return None
+    return segment.raw_data, segment.channels, segment.frame_rate
+
+
+def window_levels(frames, channels, framerate):
+    """Mean absolute amplitude of each SILENCE_WINDOW_SECONDS window (subsampled for speed)."""
+    samples = array("h", frames)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    window = max(1, int(framerate * SILENCE_WINDOW_SECONDS) * channels)
+    stride = 8
+    levels = []
+    for start in range(0, len(samples), window):
+        chunk = samples[start:start + window:stride]
+        levels.append(sum(map(abs, chunk)) / max(1, len(chunk)))
+    return levels
+
+
+def find_split_points(levels):
+    """Window indices to cut at: the quietest half-second near each SPLIT_TARGET_SECONDS mark."""
+    total_seconds = len(levels) * SILENCE_WINDOW_SECONDS
+    if total_seconds < SPLIT_MIN_SECONDS:
+        return []
+
+    # Sum over five windows so a single quiet blip inside a word does not win over a real pause
+    smoothed = [sum(levels[max(0, i - 2):i + 3]) for i in range(len(levels))]
+    points = []
+    target = SPLIT_TARGET_SECONDS
+    while target < total_seconds - SPLIT_TARGET_SECONDS / 2:
+        centre = int(target / SILENCE_WINDOW_SECONDS)
+        radius = int(SPLIT_SEARCH_SECONDS / SILENCE_WINDOW_SECONDS)
+        candidates = range(max(1, centre - radius), min(len(levels) - 1, centre + radius))
+        best = min(candidates, key=lambda i: (smoothed[i], abs(i - centre)))
+        points.append(best)
+        target = best * SILENCE_WINDOW_SECONDS + SPLIT_TARGET_SECONDS
+    return points
+
+
+def encode_wav(frames, channels, framerate):
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(framerate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def split_audio_on_silence(filename, file_bytes, content_type):
+    """Split long audio at silences into WAV chunks; short or undecodable audio stays a single chunk."""
+    whole = [AudioChunk(0.0, filename, file_bytes, content_type)]
+    decoded = decode_pcm(file_bytes, content_type)
+    if decoded is None:
+        return whole
+
+    frames, channels, framerate = decoded
+    points = find_split_points(window_levels(frames, channels, framerate))
+    if not points:
+        return whole
+
+    frame_bytes = 2 * channels
+    window_frames = int(framerate * SILENCE_WINDOW_SECONDS)
+    bounds = [0] + [point * window_frames for point in points] + [len(frames) // frame_bytes]
+    stem = os.path.splitext(filename)[0]
+    chunks = []
+    for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        chunks.append(AudioChunk(
+            offset=start / framerate,
+            filename=f"{stem}-part{index + 1:02d}.wav",
+            file_bytes=encode_wav(frames[start * frame_bytes:end * frame_bytes], channels, framerate),
+            content_type="audio/wav"
+        ))
+    return chunks
+
+
+def split_or_whole(filename, file_bytes, content_type):
+    """Background: split_audio_on_silence, keeping the recording whole if splitting fails."""
     try:
-        # Extract the inner response string
-        response_str = llm_response.get('response', '')
+        return split_audio_on_silence(filename, file_bytes, content_type)
+    except Exception:
+        logger.exception("Splitting %s failed; transcribing it whole", filename)
+        return [AudioChunk(0.0, filename, file_bytes, content_type)]
+
+
+@profiled
+def plan_audio_chunks(audio, split):
+    """Chunks to transcribe for the selected audio, memoized per recording so reruns do not re-decode it.
+
+    The memo is keyed on the uploaded file's id and size, so a rerun does not copy or hash the audio.
+    Splitting runs on the pipeline pool; until resolve_audio_plan sees it finish, "chunks" is None.
+    Only the chunks are kept, so an unsplit recording is held once as its single chunk.
+    """
+    filename, audio_file, content_type = audio
+    key = (audio_file.file_id, audio_file.size, split)
+    plan = st.session_state.audio_plan
+    if plan is None or plan["key"] != key:
+        file_bytes = audio_file.getvalue()
+        plan = {"key": key, "split": None, "chunks": None, "digest": None}
+        if split:
+            plan["split"] = get_pipeline_executor().submit(split_or_whole, filename, file_bytes, content_type)
+        else:
+            plan["chunks"] = [AudioChunk(0.0, filename, file_bytes, content_type)]
+            plan["digest"] = f"{audio_file.file_id}:{audio_file.size}:1"
+        st.session_state.audio_plan = plan
+    return plan
+
+
+def resolve_audio_plan(plan, wait=False):
+    """Take the chunks from a finished background split (or wait for it). Returns True once they are known."""
+    future = plan["split"]
+    if future is not None:
+        if not wait and not future.done():
+            return False
+        plan["chunks"] = future.result()
+        plan["digest"] = f"{plan['key'][0]}:{plan['key'][1]}:{len(plan['chunks'])}"
+        plan["split"] = None
+    return True
+
+
+def plan_audio(audio, plan):
+    """(filename, bytes, content type) of the whole recording: the single chunk, or the upload re-read when split."""
+    if len(plan["chunks"]) == 1:
+        chunk = plan["chunks"][0]
+        return chunk.filename, chunk.file_bytes, chunk.content_type
+    filename, audio_file, content_type = audio
+    return filename, audio_file.getvalue(), content_type
+
+
+def _audio_plan_poll():
+    plan = st.session_state.audio_plan
+    if plan is None or plan["split"] is None:
+        return
+    if not plan["split"].done():
+        st.info("✂️ Looking for pauses to split the recording...")
+        return
+    st.rerun()
+
+
+def offset_segments(segments, offset):
+    """Shift chunk-relative timestamps onto the timeline of the full recording."""
+    for segment in segments:
+        if segment.start is not None:
+            segment.start += offset
+        if segment.end is not None:
+            segment.end += offset
+    if segments and segments[0].start is None:
+        segments[0].start = offset
+    return segments
+
+
+def start_chunk_job(chunk, s3_key, language, token):
+    """Upload a chunk unless it was uploaded speculatively and start its transcription job."""
+    if not s3_key:
+        s3_key = upload_audio(chunk.file_bytes, chunk.filename, token, chunk.content_type)
+    return start_transcription(s3_key, language, token)
+
+
+def start_chunk_jobs(chunks, s3_keys, language, token):
+    """Start every chunk's job concurrently; pool workers are held only for the upload, not the transcription."""
+    executor = get_pipeline_executor()
+    futures = [executor.submit(start_chunk_job, chunk, s3_key, language, token) for chunk, s3_key in zip(chunks, s3_keys)]
+    return [future.result() for future in futures]
+
+
+def wait_for_transcriptions(job_names, token, max_retries=150, delay=5, on_progress=None):
+    """Wait for several jobs and return their segments in job order. Raises ApiError.
+
+    Waits on each job's completion event in turn and checks every pending job after each one;
+    the status loop is only the fallback when push is unavailable.
+    """
+    results = [None] * len(job_names)
+
+    def collect():
+        for index, job_name in enumerate(job_names):
+            if results[index] is not None:
+                continue
+            data = check_transcription(job_name, token)
+            if data is not None:
+                results[index] = parse_transcript_segments(data)
+                if on_progress is not None:
+                    on_progress(sum(result is not None for result in results), len(results))
+        return all(result is not None for result in results)
+
+    deadline = time.monotonic() + max_retries * delay
+    for index, job_name in enumerate(job_names):
+        if results[index] is not None:
+            continue
+        finished = wait_for_completion_event(job_name, token, max(1, deadline - time.monotonic()))
+        if finished is None:
+            break
+        if finished is False:
+            raise ApiError("Transcription timed out.")
+        if collect():
+            return results
 
-        # Convert the string into a proper dictionary
-        cleaned_dict = json.loads(response_str)
+    for attempt in range(max_retries):
+        if collect():
+            return results
+        time.sleep(delay)
+    raise ApiError("Transcription timed out.")
 
-        return cleaned_dict
 
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse LLM response: {e}")
+def stitch_chunk_segments(chunks, chunk_segments):
+    """Concatenate per-chunk segments in order on the timeline of the full recording.
 
-# === Helper Function: Generate Patient Report ===
-def generate_patient_report(transcript, token, language="en"):
-    """Send transcript to get patient report summary."""
-    url = f"{API_URL}/summary-patient"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "text": transcript,
-        "language": language
+    Each part is diarized by its own job, so its speaker labels are namespaced by part
+    rather than presented as the same people across parts.
+    """
+    segments = []
+    for index, (chunk, part) in enumerate(zip(chunks, chunk_segments)):
+        if len(chunks) > 1:
+            for segment in part:
+                if segment.speaker:
+                    segment.speaker = f"part{index + 1}_{segment.speaker}"
+        segments.extend(offset_segments(part, chunk.offset))
+    return segments
+
+
+@profiled
+def transcribe_chunks_in_parallel(chunks, s3_keys, language, token):
+    """Upload and transcribe every chunk concurrently and stitch the segments back in order.
+
+    Returns (job names, segments), or None after reporting the error.
+    """
+    progress = st.progress(0.0, text=f"⏳ Starting {len(chunks)} transcription jobs...")
+    try:
+        job_names = start_chunk_jobs(chunks, s3_keys, language, token)
+        progress.progress(0.0, text=f"⏳ Transcribing {len(chunks)} parts in parallel...")
+        chunk_segments = wait_for_transcriptions(
+            job_names,
+            token,
+            on_progress=lambda done, total: progress.progress(done / total, text=f"⏳ Transcribed {done} of {total} parts")
+        )
+    except ApiError as e:
+        st.error(f"❌ {e}")
+        return None
+    return job_names, stitch_chunk_segments(chunks, chunk_segments)
+
+
+# === Speculative Upload Pipeline ===
+@st.cache_resource
+def get_pipeline_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="pipeline")
+
+
+def prewarm_connections():
+    """Open keep-alive connections to the backend so the first real request skips DNS/TLS setup."""
+    try:
+        HTTP.head(API_URL, timeout=5)
+    except requests.RequestException:
+        pass
+
+
+def selected_audio(recorded_audio, uploaded_file):
+    """(filename, UploadedFile, content type) of the chosen audio input, or None. The bytes are read by plan_audio_chunks."""
+    if recorded_audio:
+        return "recorded-visit.wav", recorded_audio, "audio/wav"
+    if uploaded_file:
+        return uploaded_file.name, uploaded_file, f"audio/{uploaded_file.type}"
+    return None
+
+
+def cancel_speculative_upload():
+    upload = st.session_state.speculative_upload
+    if upload:
+        upload["cancel"].set()
+        for future in upload["futures"]:
+            future.cancel()
+        st.session_state.speculative_upload = None
+
+
+@profiled
+def update_speculative_upload(plan):
+    """Start uploading every chunk of new audio in the background, cancelling uploads of discarded audio."""
+    if plan is None or not resolve_audio_plan(plan):
+        cancel_speculative_upload()
+        return
+
+    upload = st.session_state.speculative_upload
+    if upload and upload["digest"] == plan["digest"]:
+        return
+
+    cancel_speculative_upload()
+    cancel_event = threading.Event()
+    executor = get_pipeline_executor()
+    st.session_state.speculative_upload = {
+        "digest": plan["digest"],
+        "cancel": cancel_event,
+        "futures": [
+            executor.submit(upload_audio, chunk.file_bytes, chunk.filename, st.session_state.jwt_token, chunk.content_type, cancel_event)
+            for chunk in plan["chunks"]
+        ]
     }
-    response = requests.post(url, json=payload, headers=headers)
-    
-    if response.status_code != 200:
-        st.error(f"❌ Failed to generate report: {response.status_code} - {response.text}")
+
+
+def claim_speculative_upload(plan):
+    """Take ownership of the speculative upload futures for this plan, or None if they belong to other audio."""
+    upload = st.session_state.speculative_upload
+    st.session_state.speculative_upload = None
+    if not upload or upload["digest"] != plan["digest"]:
         return None
+    return upload["futures"]
+
+
+def resolve_speculative_upload(futures, count):
+    """S3 keys of finished speculative uploads (None where a chunk must be uploaded normally)."""
+    if futures is None:
+        return [None] * count
 
+    s3_keys = []
+    for future in futures:
+        try:
+            s3_keys.append(future.result())
+        except Exception:
+            # Failed or cancelled in the background; the regular path retries and reports errors
+            s3_keys.append(None)
+    return s3_keys
+
+
+def take_speculative_upload(plan):
+    """S3 keys of the speculative uploads for this plan (None where a chunk must be uploaded normally)."""
+    return resolve_speculative_upload(claim_speculative_upload(plan), len(plan["chunks"]))
+
+
+# === Transcript Segments ===
+@dataclass
+class TranscriptSegment:
+    """One utterance of the transcript; times are seconds from the start of the audio."""
+    text: str
+    speaker: str = None
+    start: float = None
+    end: float = None
+
+
+def _to_seconds(value):
     try:
-        # Extract dictionary from the response text
-        response_dictt = json.loads(response.text)
-        report_dict = clean_llm_response(response_dictt)
-        return report_dict
-    except ValueError as e:
-        st.error(f"❌ Failed to process report response: {e}")
+        return float(value)
+    except (TypeError, ValueError):
         return None
-    
-def generate_doctor_report(transcript, token, language="en"):
-    """Send transcript to get doctor report summary."""
-    url = f"{API_URL}/summary-doctor"
+
+
+def split_flat_transcript(text):
+    """Break an unstructured transcript into sentence-aligned segments without timestamps."""
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    segments, current = [], ""
+    for sentence in sentences:
+        if current and len(current) + len(sentence) > FALLBACK_SEGMENT_CHARS:
+            segments.append(TranscriptSegment(text=current))
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        segments.append(TranscriptSegment(text=current))
+    return segments
+
+
+def parse_transcript_segments(data):
+    """Build segments from a transcription result.
+
+    Understands a backend `segments` list, Amazon Transcribe `results.audio_segments`
+    (with speaker labels when diarization is on), and falls back to the flat `transcript` text.
+    """
+    raw_segments = data.get("segments")
+    if raw_segments is None:
+        raw_segments = (data.get("results") or {}).get("audio_segments")
+
+    if raw_segments:
+        segments = []
+        for raw in raw_segments:
+            text = raw.get("text", raw.get("transcript", "")).strip()
+            if not text:
+                continue
+            segments.append(TranscriptSegment(
+                text=text,
+                speaker=raw.get("speaker") or raw.get("speaker_label"),
+                start=_to_seconds(raw.get("start", raw.get("start_time"))),
+                end=_to_seconds(raw.get("end", raw.get("end_time")))
+            ))
+        if segments:
+            return segments
+
+    return split_flat_transcript(data.get("transcript", ""))
+
+
+def segments_to_text(segments):
+    """Flatten segments into the plain text sent to the summary endpoints."""
+    lines = []
+    for segment in segments:
+        lines.append(f"{segment.speaker}: {segment.text}" if segment.speaker else segment.text)
+    return "\n".join(lines)
+
+
+def format_timestamp(seconds):
+    if seconds is None:
+        return ""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def set_transcript_segments(segments):
+    """Replace the session transcript; bumping the version resets the editor widgets."""
+    st.session_state.transcript_segments = segments
+    st.session_state.transcript_version += 1
+    st.session_state.transcript_page = 0
+    st.session_state.current_transcript = segments_to_text(segments)
+
+
+def _update_segment(index, widget_key):
+    # Only the edited segment is written back; the flat text is rebuilt for the summary calls
+    segments = st.session_state.transcript_segments
+    segments[index].text = st.session_state[widget_key]
+    st.session_state.current_transcript = segments_to_text(segments)
+
+
+@st.fragment
+def transcript_editor():
+    """Paginated segment editor; only the visible page's widgets are sent to the browser."""
+    segments = st.session_state.transcript_segments
+    page_count = max(1, -(-len(segments) // SEGMENTS_PER_PAGE))
+    page = min(st.session_state.transcript_page, page_count - 1)
+
+    if page_count > 1:
+        page = st.number_input(
+            f"Page (of {page_count})",
+            min_value=1,
+            max_value=page_count,
+            value=page + 1,
+            key=f"transcript_page_{st.session_state.transcript_version}"
+        ) - 1
+        st.session_state.transcript_page = page
+
+    first = page * SEGMENTS_PER_PAGE
+    for index in range(first, min(first + SEGMENTS_PER_PAGE, len(segments))):
+        segment = segments[index]
+        label = " ".join(part for part in [
+            f"[{format_timestamp(segment.start)}]" if segment.start is not None else "",
+            segment.speaker or "",
+        ] if part) or f"Segment {index + 1}"
+        widget_key = f"segment_{st.session_state.transcript_version}_{index}"
+        st.text_area(
+            label,
+            value=segment.text,
+            height=80,
+            key=widget_key,
+            on_change=_update_segment,
+            args=(index, widget_key)
+        )
+
+
+# === Helper Function: Parse Summary Response ===
+def parse_report(response):
+    """Turn a summary endpoint response into a Report."""
+    return Report.from_dict(clean_llm_response(loads_json(response.content)))
+
+
+# === Helper Function: Compressed JSON POST ===
+def encode_json_body(payload):
+    """Serialize a payload to JSON and compress it, returning the body and its Content-Encoding (or None)."""
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    if REQUEST_COMPRESSION == "none" or len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    if REQUEST_COMPRESSION == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def post_json(url, payload, token):
+    """POST a JSON payload with request compression and compressed responses negotiated."""
+    body, encoding = encode_json_body(payload)
     headers = {
         "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        # Only the encodings urllib3 can actually decode here (zstd needs urllib3 2 and zstandard)
+        "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING
     }
-    payload = {
-        "text": transcript,
-        "language": language
-    }
-    response = requests.post(url, json=payload, headers=headers)
-    
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return HTTP.post(url, data=body, headers=headers)
+
+# === Helper Function: Server-side Transcript Reference ===
+def transcript_digest(transcript):
+    """Content digest used to key a stored transcript."""
+    return hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+
+
+@st.cache_resource
+def get_transcript_store_support():
+    """Remembers whether the backend offers /store-transcript, so a missing endpoint is only paid once."""
+    return {"available": True}
+
+
+@st.cache_resource
+def get_expired_transcript_refs():
+    """References the backend has answered 404 for; background summary calls record them here."""
+    return set()
+
+
+def get_transcript_ref(transcript, token, job_name=None):
+    """Upload the transcript once and return the backend reference, or None to send it inline."""
+    support = get_transcript_store_support()
+    if not USE_TRANSCRIPT_REFS or not support["available"]:
+        return None
+
+    digest = transcript_digest(transcript)
+    refs = st.session_state.setdefault("transcript_refs", {})
+    if refs.get(digest) in get_expired_transcript_refs():
+        # Reference expired on the backend: forget it and store the transcript again
+        del refs[digest]
+    if digest in refs:
+        return refs[digest]
+
+    response = post_json(f"{API_URL}/store-transcript", {"text": transcript, "digest": digest, "job_name": job_name}, token)
+    if response.status_code in (404, 405, 501):
+        # Backend without transcript storage: stop trying and keep sending the full text
+        support["available"] = False
+        return None
     if response.status_code != 200:
-        st.error(f"❌ Failed to generate report: {response.status_code} - {response.text}")
         return None
 
-    try:
-        # Extract dictionary from the response text
-        response_dictt = json.loads(response.text)
-        report_dict = clean_llm_response(response_dictt)
-        return report_dict
-    except ValueError as e:
-        st.error(f"❌ Failed to process report response: {e}")
+    ref = response.json().get("transcript_ref") or digest
+    refs[digest] = ref
+    return ref
+
+# === Helper Function: Generate Summary Report ===
+def fetch_summary(endpoint, transcript, token, language="en", transcript_ref=None):
+    """Background-safe summary call, by stored reference when given. Raises ApiError or ValueError."""
+    url = f"{API_URL}/{endpoint}"
+    response = None
+    if transcript_ref:
+        response = post_json(url, {"transcript_ref": transcript_ref, "language": language}, token)
+    if response is None or response.status_code == 404:
+        if response is not None:
+            get_expired_transcript_refs().add(transcript_ref)
+        response = post_json(url, {"text": transcript, "language": language}, token)
+    if response.status_code != 200:
+        raise ApiError(f"Failed to generate report: {response.status_code} - {response.text}", response.status_code)
+    return parse_report(response)
+
+# === Offline Outbox ===
+class Outbox:
+    """Durable on-disk queue of pending audio uploads and summary requests.
+
+    Each entry is a JSON metadata file plus an optional `.bin` blob (the audio). Tokens are
+    never written to disk; the flusher uses the latest token registered for the entry's owner,
+    so queued work waits for the doctor to be logged in.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._tokens = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, entry_id, suffix):
+        return os.path.join(self.root, f"{entry_id}{suffix}")
+
+    def _write(self, entry):
+        tmp_path = self._path(entry["id"], ".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(entry["id"], ".json"))
+
+    def register_token(self, token):
+        owner = token_subject(token)
+        if owner:
+            self._tokens[owner] = token
+        return owner
+
+    def enqueue(self, kind, payload, blob=None, token=None, visit_id=None, result=None):
+        """Persist a request for a visit; defaults to the current session's doctor and visit. Returns the entry id.
+
+        An entry given a `result` is stored as already done, e.g. a job that only needs to be opened.
+        """
+        entry = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "owner": self.register_token(token or st.session_state.jwt_token),
+            "visit_id": visit_id or st.session_state.visit_id or "visit",
+            "payload": payload,
+            "status": "pending" if result is None else "done",
+            "attempts": 0,
+            "next_attempt": 0,
+            "created": time.time(),
+            "error": None,
+            "result": result
+        }
+        if blob is not None:
+            with open(self._path(entry["id"], ".bin"), "wb") as f:
+                f.write(blob)
+        with self._lock:
+            self._write(entry)
+        return entry["id"]
+
+    def entries(self, owner=None):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if owner is None or entry["owner"] == owner:
+                entries.append(entry)
+        return sorted(entries, key=lambda entry: entry["created"])
+
+    def update(self, entry, **changes):
+        entry.update(changes)
+        with self._lock:
+            self._write(entry)
+
+    def remove(self, entry_id):
+        for suffix in (".json", ".bin"):
+            try:
+                os.remove(self._path(entry_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _send(self, entry, token):
+        payload = entry["payload"]
+        if entry["kind"] == "transcription":
+            with open(self._path(entry["id"], ".bin"), "rb") as f:
+                file_bytes = f.read()
+            job_name = upload_and_start_transcription(file_bytes, payload["filename"], payload["language"], token, payload["content_type"])
+            return {"job_name": job_name}
+
+        return {"report": fetch_summary(payload["endpoint"], payload["text"], token, payload["language"]).to_dict()}
+
+    def flush(self, batch_size=OUTBOX_BATCH_SIZE):
+        """Send up to `batch_size` due entries; stops the pass at the first network failure."""
+        now = time.time()
+        due = [entry for entry in self.entries()
+               if entry["status"] == "pending" and entry["next_attempt"] <= now and entry["owner"] in self._tokens]
+        for entry in due[:batch_size]:
+            token = self._tokens.get(entry["owner"])
+            try:
+                result = self._send(entry, token)
+            except (ApiError, *OFFLINE_ERRORS) as e:
+                error = str(e)
+                if isinstance(e, ApiError) and e.status_code in (401, 403):
+                    # Expired login: keep the entry and wait for the doctor's next token
+                    if self._tokens.get(entry["owner"]) == token:
+                        self._tokens.pop(entry["owner"], None)
+                    error = "Login expired; will resume after the doctor logs in again."
+                elif isinstance(e, ApiError) and not e.retryable:
+                    self.update(entry, status="failed", error=error)
+                    continue
+                attempts = entry["attempts"] + 1
+                backoff = min(OUTBOX_MAX_BACKOFF, OUTBOX_FLUSH_INTERVAL * 2 ** attempts)
+                self.update(entry, attempts=attempts, next_attempt=time.time() + backoff, error=error)
+                if not isinstance(e, ApiError):
+                    # Still offline; leave the rest of the batch for the next pass
+                    break
+            except Exception as e:
+                # Corrupt entry or missing audio file: stop retrying it, the doctor can retry or discard
+                logger.exception("Outbox entry %s failed", entry["id"])
+                self.update(entry, status="failed", error=str(e) or type(e).__name__)
+            else:
+                self.update(entry, status="done", result=result, error=None)
+                try:
+                    os.remove(self._path(entry["id"], ".bin"))
+                except FileNotFoundError:
+                    pass
+
+    def run_forever(self):
+        while True:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Outbox flush failed")
+            time.sleep(OUTBOX_FLUSH_INTERVAL)
+
+
+@st.cache_resource
+def get_outbox():
+    outbox = Outbox(OUTBOX_DIR)
+    threading.Thread(target=outbox.run_forever, name="outbox-flusher", daemon=True).start()
+    return outbox
+
+
+def summary_pair(entries, entry):
+    """The finished doctor and patient report entries for the same visit and language, or None."""
+    pair = [
+        other for other in entries
+        if other["kind"] == "summary" and other["status"] == "done"
+        and other["visit_id"] == entry["visit_id"]
+        and other["payload"]["language"] == entry["payload"]["language"]
+    ]
+    audiences = {other["payload"]["endpoint"] for other in pair}
+    if audiences != {f"summary-{audience}" for audience in REPORT_AUDIENCES}:
         return None
-    
-    
+    return pair
+
+
+@profiled
+def outbox_status_panel():
+    """Per-visit status of queued uploads and report requests, with actions for finished entries."""
+    outbox = get_outbox()
+    owner = outbox.register_token(st.session_state.jwt_token)
+    entries = outbox.entries(owner)
+    if not entries:
+        return
+
+    with st.expander(f"📮 Offline queue ({len(entries)})", expanded=True):
+        for entry in entries:
+            if entry["kind"] == "summary":
+                kind = f"Report ({entry['payload']['endpoint']})"
+            else:
+                kind = "Transcription" if "job_name" in entry["payload"] else "Audio upload"
+            status = entry["status"]
+            if status == "pending" and entry["attempts"]:
+                wait = max(0, int(entry["next_attempt"] - time.time()))
+                status = f"retrying in {wait}s (attempt {entry['attempts']})"
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.markdown(f"**{entry['visit_id']}** · {kind} · {status}")
+                if entry["error"]:
+                    st.caption(entry["error"])
+            with col2:
+                if entry["status"] == "done" and entry["kind"] == "transcription":
+                    if st.button("Open", key=f"outbox_open_{entry['id']}"):
+                        job_name = entry["result"]["job_name"]
+                        segments = poll_transcription_status(job_name, st.session_state.jwt_token)
+                        if segments:
+                            st.session_state.current_job_name = job_name
+                            st.session_state.visit_id = entry["visit_id"]
+                            st.session_state.final_pass = None
+                            set_transcript_segments(segments)
+                            outbox.remove(entry["id"])
+                            st.rerun()
+                elif entry["status"] == "done":
+                    # Both editors must switch language together, so a report only opens with its pair
+                    pair = summary_pair(entries, entry)
+                    if pair is None:
+                        st.caption("Waiting for the other report")
+                        if st.button("Discard", key=f"outbox_discard_{entry['id']}"):
+                            outbox.remove(entry["id"])
+                            st.rerun()
+                    elif st.button("Open", key=f"outbox_open_{entry['id']}"):
+                        language = entry["payload"]["language"]
+                        keep_live_edits()
+                        for done in pair:
+                            audience = done["payload"]["endpoint"].removeprefix("summary-")
+                            st.session_state.reports_by_language.setdefault(language, {})[audience] = Report.from_dict(done["result"]["report"])
+                            outbox.remove(done["id"])
+                        show_report_language(language)
+                        st.rerun()
+                elif entry["status"] == "failed":
+                    if st.button("Retry", key=f"outbox_retry_{entry['id']}"):
+                        outbox.update(entry, status="pending", attempts=0, next_attempt=0, error=None)
+                        st.rerun()
+                    if st.button("Discard", key=f"outbox_discard_{entry['id']}"):
+                        outbox.remove(entry["id"])
+                        st.rerun()
+
+# === PDF Locale Registry ===
+PDF_LOCALES = {}
+
+
+def register_locale(code, labels):
+    """Add or override the PDF labels for a language; labels it leaves out fall back to English."""
+    PDF_LOCALES[code] = {**PDF_LOCALES.get("en", {}), **labels}
+
+
+register_locale("en", {
+    "report_title": "Medical Report",
+    "patient_name": "Patient Name:",
+    "id_number": "ID Number:",
+    "dob": "Date of Birth:",
+    "reason_for_visit": "Reason for Visit:",
+    "chief_complaint": "Chief Complaint & History of Present Illness",
+    "clinical_findings": "Clinical Examination & Diagnostic Findings",
+    "diagnosis_treatment": "Diagnosis and Treatment Plan",
+    "medications": "Medication Prescription",
+    "follow_up": "Follow-Up & Recommendations",
+    "visit_date": "Visit Date:",
+    "specialist_in": "Specialist in",
+    "contact": "Contact:",
+    "email": "Email:"
+})
+register_locale("it", {
+    "report_title": "Referto Medico",
+    "patient_name": "Nome Paziente:",
+    "id_number": "Numero ID:",
+    "dob": "Data di Nascita:",
+    "reason_for_visit": "Motivo della Visita:",
+    "chief_complaint": "Anamnesi e Sintomatologia",
+    "clinical_findings": "Esame Clinico e Risultati Diagnostici",
+    "diagnosis_treatment": "Diagnosi e Piano di Trattamento",
+    "medications": "Prescrizione Medica",
+    "follow_up": "Follow-Up e Raccomandazioni",
+    "visit_date": "Data della Visita:",
+    "specialist_in": "Specialista in",
+    "contact": "Contatti:",
+    "email": "Email:"
+})
+
+
 def generate_pdf(info, report, language):
-    """Generate a styled patient report PDF in English or Italian using ReportLab."""
+    """Generate a styled patient report PDF in any registered locale using ReportLab."""
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
 
@@ -258,37 +1482,7 @@ def generate_pdf(info, report, language):
 
     elements = []
 
-    # Translation for Sections
-    translations = {
-        "en": {
-            "report_title": "Medical Report",
-            "patient_name": "Patient Name:",
-            "id_number": "ID Number:",
-            "dob": "Date of Birth:",
-            "reason_for_visit": "Reason for Visit:",
-            "chief_complaint": "Chief Complaint & History of Present Illness",
-            "clinical_findings": "Clinical Examination & Diagnostic Findings",
-            "diagnosis_treatment": "Diagnosis and Treatment Plan",
-            "medications": "Medication Prescription",
-            "follow_up": "Follow-Up & Recommendations",
-            "visit_date": "Visit Date:"
-        },
-        "it": {
-            "report_title": "Referto Medico",
-            "patient_name": "Nome Paziente:",
-            "id_number": "Numero ID:",
-            "dob": "Data di Nascita:",
-            "reason_for_visit": "Motivo della Visita:",
-            "chief_complaint": "Anamnesi e Sintomatologia",
-            "clinical_findings": "Esame Clinico e Risultati Diagnostici",
-            "diagnosis_treatment": "Diagnosi e Piano di Trattamento",
-            "medications": "Prescrizione Medica",
-            "follow_up": "Follow-Up e Raccomandazioni",
-            "visit_date": "Data della Visita:"
-        }
-    }
-
-    labels = translations.get(language, translations["en"])  # Default to English if language is missing
+    labels = PDF_LOCALES.get(language, PDF_LOCALES["en"])  # Default to English if language is missing
 
     # Header (Doctor Info + Logo)
     header_table = []
@@ -302,9 +1496,9 @@ def generate_pdf(info, report, language):
 
     doctor_info = [
         Paragraph(f"<strong>{info['doctor_name']}</strong>", body_style),
-        Paragraph(f"Specialist in {info['specialization']}", body_style),
-        Paragraph(f"Contact: {info['contact']}", body_style),
-        Paragraph(f"Email: {info['email']}", body_style)
+        Paragraph(f"{labels['specialist_in']} {info['specialization']}", body_style),
+        Paragraph(f"{labels['contact']} {info['contact']}", body_style),
+        Paragraph(f"{labels['email']} {info['email']}", body_style)
     ]
 
     header_table.append([logo, doctor_info])
@@ -324,7 +1518,7 @@ def generate_pdf(info, report, language):
         [labels["patient_name"], info["patient"]["name"]],
         [labels["id_number"], info["patient"]["med_number"]],
         [labels["dob"], info["patient"]["birth_date"]],
-        [labels["reason_for_visit"], report["reason_for_visit"]]
+        [labels["reason_for_visit"], report.reason_for_visit]
     ]
     table = Table(patient_table, colWidths=[150, 350])
     table.setStyle(TableStyle([
@@ -344,11 +1538,11 @@ def generate_pdf(info, report, language):
         elements.append(Paragraph(content or "N/A", body_style))
         elements.append(Spacer(1, 12))
 
-    add_section(labels["chief_complaint"], report["chief_complaint_history"])
-    add_section(labels["clinical_findings"], report["clinical_findings"])
-    add_section(labels["diagnosis_treatment"], report["diagnosis_treatment_plan"])
-    add_section(labels["medications"], report["medication_prescription"])
-    add_section(labels["follow_up"], report["follow_up_recommendations"])
+    add_section(labels["chief_complaint"], report.chief_complaint_history)
+    add_section(labels["clinical_findings"], report.clinical_findings)
+    add_section(labels["diagnosis_treatment"], report.diagnosis_treatment_plan)
+    add_section(labels["medications"], report.medication_prescription)
+    add_section(labels["follow_up"], report.follow_up_recommendations)
 
     # Footer
     elements.append(Spacer(1, 50))
@@ -368,8 +1562,612 @@ def generate_pdf(info, report, language):
     doc.build(elements)
     buffer.seek(0)
     return buffer
+
+# === Visit Queue ===
+@dataclass
+class QueuedVisit:
+    """A visit moving through transcription and reporting in the background."""
+    visit_id: str
+    owner: str
+    patient: dict
+    language: str
+    status: str = "queued"
+    created: float = field(default_factory=time.time)
+    job_names: list = field(default_factory=list)
+    segments: list = field(default_factory=list)
+    patient_report: Report = None
+    doctor_report: Report = None
+    error: str = None
+
+    @property
+    def in_progress(self):
+        return self.status in ("queued", "uploading", "transcribing", "summarizing")
+
+
+class VisitQueue:
+    """Per-doctor visits processed concurrently so back-to-back appointments do not wait on each other."""
+
+    def __init__(self, workers):
+        self._visits = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="visit")
+
+    def submit(self, visit, token, chunks, upload_futures, audio):
+        with self._lock:
+            self._visits.setdefault(visit.owner, OrderedDict())[visit.visit_id] = visit
+        self._executor.submit(self._process, visit, token, chunks, upload_futures, audio)
+
+    def visits(self, owner):
+        with self._lock:
+            return list(self._visits.get(owner, {}).values())
+
+    def get(self, owner, visit_id):
+        with self._lock:
+            return self._visits.get(owner, {}).get(visit_id)
+
+    def remove(self, owner, visit_id):
+        with self._lock:
+            self._visits.get(owner, {}).pop(visit_id, None)
+
+    def _process(self, visit, token, chunks, upload_futures, audio):
+        pipeline = get_pipeline_executor()
+        transcribed = False
+        try:
+            visit.status = "uploading"
+            s3_keys = resolve_speculative_upload(upload_futures, len(chunks))
+
+            visit.status = "transcribing"
+            visit.job_names = start_chunk_jobs(chunks, s3_keys, visit.language, token)
+            # Waiting happens on this visit's own worker, not on the shared pipeline pool
+            visit.segments = stitch_chunk_segments(chunks, wait_for_transcriptions(visit.job_names, token))
+            transcribed = True
+
+            visit.status = "summarizing"
+            transcript = segments_to_text(visit.segments)
+            doctor = pipeline.submit(fetch_summary, "summary-doctor", transcript, token, visit.language)
+            patient = pipeline.submit(fetch_summary, "summary-patient", transcript, token, visit.language)
+            visit.doctor_report = doctor.result()
+            visit.patient_report = patient.result()
+            visit.status = "ready"
+        except OFFLINE_ERRORS:
+            # Hand whatever is still missing to the outbox so the visit survives the outage
+            outbox = get_outbox()
+            if transcribed:
+                transcript = segments_to_text(visit.segments)
+                for endpoint in ("summary-doctor", "summary-patient"):
+                    outbox.enqueue("summary", {"endpoint": endpoint, "text": transcript, "language": visit.language}, token=token, visit_id=visit.visit_id)
+            else:
+                # Not every part finished: re-transcribe the whole recording rather than summarize a partial visit
+                filename, file_bytes, content_type = audio
+                outbox.enqueue("transcription", {"filename": filename, "language": visit.language, "content_type": content_type},
+                               blob=file_bytes, token=token, visit_id=visit.visit_id)
+            visit.status = "offline"
+            visit.error = "Connection lost; moved to the offline queue."
+        except (ApiError, ValueError) as e:
+            visit.status = "failed"
+            visit.error = str(e)
+        except Exception as e:
+            # Anything unexpected must still end the visit, or the dashboard would poll forever
+            logger.exception("Visit %s failed", visit.visit_id)
+            visit.status = "failed"
+            visit.error = str(e) or type(e).__name__
+
+
+@st.cache_resource
+def get_visit_queue():
+    return VisitQueue(VISIT_WORKERS)
+
+
+def queue_visit(audio, plan, language, patient):
+    """Send the selected audio through the background pipeline and free the inputs for the next visit."""
+    token = st.session_state.jwt_token
+    visit = QueuedVisit(
+        visit_id=f"{patient['med_number'] or 'visit'}-{time.strftime('%Y%m%d-%H%M%S')}",
+        owner=token_subject(token),
+        patient=patient,
+        language=language
+    )
+    get_visit_queue().submit(visit, token, plan["chunks"], claim_speculative_upload(plan), audio)
+
+    # New widget keys clear the recorder and uploader
+    st.session_state.audio_widget_version += 1
+    st.session_state.audio_source = None
+    st.session_state.audio_plan = None
+
+
+def open_queued_visit(visit_id):
+    """Load a finished visit into the review slots (runs as a button callback, before widgets are created)."""
+    visit = get_visit_queue().get(token_subject(st.session_state.jwt_token), visit_id)
+    if visit is None:
+        return
+    st.session_state.visit_id = visit.visit_id
+    st.session_state.current_job_name = ",".join(visit.job_names)
+    st.session_state.final_pass = None
+    st.session_state.final_pass_result = None
+    set_transcript_segments(visit.segments)
+    st.session_state.reports_by_language = {}
+    store_report(visit.language, "patient", visit.patient_report)
+    store_report(visit.language, "doctor", visit.doctor_report)
+    st.session_state.patient_id_input = visit.patient["med_number"]
+    st.session_state.patient_name_input = visit.patient["name"]
+    st.session_state.date_of_birth_input = date.fromisoformat(visit.patient["birth_date"])
+    st.session_state.language_select = visit.language
+
+
+def _visit_queue_rows():
+    owner = token_subject(st.session_state.jwt_token)
+    queue = get_visit_queue()
+    visits = queue.visits(owner)
+    if not visits:
+        return
+
+    st.markdown("### 🗂️ Visit Queue")
+    for visit in visits:
+        col1, col2, col3 = st.columns([4, 1, 1])
+        with col1:
+            name = visit.patient["name"] or visit.patient["med_number"] or "Unnamed patient"
+            st.markdown(f"**{name}** · {visit.visit_id} · {visit.status}")
+            if visit.error:
+                st.caption(visit.error)
+        with col2:
+            if visit.status == "ready":
+                if st.button("Open", key=f"visit_open_{visit.visit_id}", on_click=open_queued_visit, args=(visit.visit_id,)):
+                    # The button lives in a fragment; redraw the whole page with the opened visit
+                    st.rerun()
+        with col3:
+            if not visit.in_progress and st.button("Remove", key=f"visit_remove_{visit.visit_id}"):
+                queue.remove(owner, visit.visit_id)
+                st.rerun(scope="fragment")
+
+    if not any(visit.in_progress for visit in visits) and st.session_state.visit_queue_polling:
+        # Last job finished: one full rerun stops the auto-refresh
+        st.session_state.visit_queue_polling = False
+        st.rerun()
+
+
+@profiled
+def visit_queue_dashboard():
+    """Status of queued visits; refreshes itself while any visit is still being processed."""
+    visits = get_visit_queue().visits(token_subject(st.session_state.jwt_token))
+    st.session_state.visit_queue_polling = any(visit.in_progress for visit in visits)
+    run_every = VISIT_REFRESH_SECONDS if st.session_state.visit_queue_polling else None
+    st.fragment(_visit_queue_rows, run_every=run_every)()
+
+
+# === PDF Rendering Cache ===
+class PdfCache:
+    """Thread-safe LRU cache of rendered PDF bytes, bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.total_bytes -= len(self._items.pop(key))
+            self._items[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+
+@st.cache_resource
+def get_pdf_cache():
+    return PdfCache(PDF_CACHE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_pdf_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-render")
+
+
+def pdf_cache_key(info, report, language):
+    """Hash of everything that affects the rendered PDF."""
+    content = json.dumps([info, report.to_dict(), language], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def render_pdf_bytes(key, info, report, language):
+    """Render a PDF (runs on the background executor) and store the bytes in the cache."""
+    data = generate_pdf(info, report, language).getvalue()
+    get_pdf_cache().put(key, data)
+    return data
+
+
+def submit_pdf_render(info, report, language):
+    """Start rendering in the background unless the PDF is cached, already rendering or already failed.
+
+    Returns the cache key. A failed render is not retried until the content (and so the key) changes.
+    """
+    key = pdf_cache_key(info, report, language)
+    if get_pdf_cache().get(key) is not None or key in st.session_state.pdf_failures:
+        return key
+
+    jobs = st.session_state.pdf_jobs
+    # Finished renders of other content would otherwise keep their bytes in the session outside the LRU limit
+    for stale_key, future in list(jobs.items()):
+        if stale_key != key and future.done():
+            if future.exception() is not None:
+                st.session_state.pdf_failures[stale_key] = str(future.exception())
+            del jobs[stale_key]
+
+    if key not in jobs:
+        # Snapshot the info so later edits in the session cannot race the worker; saving builds a new Report
+        info = json.loads(json.dumps(info, default=str))
+        jobs[key] = get_pdf_executor().submit(render_pdf_bytes, key, info, report, language)
+    return key
+
+
+def get_rendered_pdf(key, wait=False):
+    """Return cached PDF bytes for a key, optionally waiting for an in-flight render.
+
+    Failures are remembered per key and only reported when the doctor asks for the PDF (`wait=True`).
+    """
+    data = get_pdf_cache().get(key)
+    if data is not None:
+        st.session_state.pdf_jobs.pop(key, None)
+        return data
+
+    failures = st.session_state.pdf_failures
+    future = st.session_state.pdf_jobs.get(key)
+    if key not in failures:
+        if future is None or (not wait and not future.done()):
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            failures[key] = str(e)
+        finally:
+            st.session_state.pdf_jobs.pop(key, None)
+
+    if wait:
+        st.error(f"❌ Failed to generate PDF: {failures[key]}")
+    return None
+
+
+def build_pdf_info(type_report, patient_name, date_of_birth, patient_id):
+    """Collect doctor settings and patient details for the PDF header."""
+    return {
+        "doctor_name": st.session_state.doctor_settings["doctor_name"],
+        "specialization": st.session_state.doctor_settings["specialization"],
+        "contact": st.session_state.doctor_settings["contact"],
+        "email": st.session_state.doctor_settings["email"],
+        "visit_date": time.strftime("%Y-%m-%d"),
+        "type_report": type_report,
+        "logo_path": "logo.png",
+        "patient": {
+            "name": patient_name,
+            "birth_date": date_of_birth.strftime("%Y-%m-%d"),
+            "med_number": patient_id
+        }
+    }
+
+
+@profiled
+def pdf_download_section(type_report, report, language, patient_name, date_of_birth, patient_id):
+    """Render the PDF in the background and offer the download as soon as it is ready."""
+    prefix = type_report.lower()
+    info = build_pdf_info(type_report, patient_name, date_of_birth, patient_id)
+    key = submit_pdf_render(info, report, language)
+
+    pdf_bytes = get_rendered_pdf(key)
+    if pdf_bytes is None and st.button("Generate PDF", type="secondary", key=f"gen_{prefix}_pdf"):
+        with st.spinner("⏳ Rendering PDF..."):
+            pdf_bytes = get_rendered_pdf(key, wait=True)
+
+    if pdf_bytes is not None:
+        st.download_button(
+            label="Download PDF",
+            data=pdf_bytes,
+            file_name=f"{prefix}_report_{patient_id}.pdf",
+            mime="application/pdf",
+            key=f"download_{prefix}_pdf"
+        )
     
+# === Multi-language Report Fan-out ===
+REPORT_AUDIENCES = ("patient", "doctor")
+
+
+@profiled
+def generate_reports_fanout(transcript, token, languages):
+    """Summarize one transcript into every language for both audiences concurrently.
+
+    Returns {language: {"patient": report, "doctor": report}} for the languages where both reports succeeded.
+    """
+    try:
+        transcript_ref = get_transcript_ref(transcript, token, st.session_state.current_job_name)
+    except OFFLINE_ERRORS:
+        transcript_ref = None
+
+    executor = get_pipeline_executor()
+    futures = {
+        (language, audience): executor.submit(fetch_summary, f"summary-{audience}", transcript, token, language, transcript_ref)
+        for language in languages
+        for audience in REPORT_AUDIENCES
+    }
+
+    results = {}
+    offline_languages = set()
+    for (language, audience), future in futures.items():
+        try:
+            results.setdefault(language, {})[audience] = future.result()
+        except OFFLINE_ERRORS:
+            offline_languages.add(language)
+        except (ApiError, ValueError) as e:
+            st.error(f"❌ Failed to generate {audience} report ({language}): {e}")
+
+    # Queue both audiences of a language so the outbox can open them as a pair
+    for language in offline_languages:
+        results.pop(language, None)
+        for audience in REPORT_AUDIENCES:
+            get_outbox().enqueue("summary", {"endpoint": f"summary-{audience}", "text": transcript, "language": language})
+
+    if offline_languages:
+        st.warning("📮 Connection lost. Missing reports were queued and will be sent once the network is back.")
+    return {language: reports for language, reports in results.items() if len(reports) == len(REPORT_AUDIENCES)}
+
+
+def store_report(language, audience, report, reset_editors=True):
+    """Keep a report for its language and show it in the editors."""
+    st.session_state.reports_by_language.setdefault(language, {})[audience] = report
+    st.session_state.report_language = language
+    st.session_state[f"{audience}_report"] = report
+    if reset_editors:
+        st.session_state.report_version += 1
+
+
+def show_report_language(language):
+    """Load another language's reports into the editors."""
+    for audience, report in st.session_state.reports_by_language.get(language, {}).items():
+        store_report(language, audience, report)
+
+
+def keep_live_edits():
+    """Store the shown language's editor values, saved or not, before the editors are recreated."""
+    language = st.session_state.report_language
+    for audience in REPORT_AUDIENCES:
+        report = live_report(language, audience)
+        if report is not None:
+            st.session_state.reports_by_language[language][audience] = report
+
+
+def batch_pdf_section(patient_name, date_of_birth, patient_id):
+    """Render the PDFs for every generated language and audience together and offer them as one zip."""
+    reports_by_language = st.session_state.reports_by_language
+    if len(reports_by_language) < 2:
+        return
+
+    files = []
+    for language, reports in reports_by_language.items():
+        for audience, report in reports.items():
+            info = build_pdf_info(audience.title(), patient_name, date_of_birth, patient_id)
+            files.append((f"{audience}_report_{patient_id}_{language}.pdf", submit_pdf_render(info, report, language)))
+
+    pdfs = [(name, get_rendered_pdf(key)) for name, key in files]
+    if any(data is None for _, data in pdfs):
+        if not st.button("📦 Generate PDFs for all languages", type="secondary", key="gen_all_pdfs"):
+            return
+        with st.spinner("⏳ Rendering PDFs..."):
+            pdfs = [(name, get_rendered_pdf(key, wait=True)) for name, key in files]
+        if any(data is None for _, data in pdfs):
+            return
+
+    # The zip is cached like the PDFs, under the names and render keys it bundles
+    zip_key = hashlib.sha256(json.dumps(files).encode("utf-8")).hexdigest()
+    zip_bytes = get_pdf_cache().get(zip_key)
+    if zip_bytes is None:
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, data in pdfs:
+                archive.writestr(name, data)
+        zip_bytes = buffer.getvalue()
+        get_pdf_cache().put(zip_key, zip_bytes)
+    st.download_button(
+        label="📦 Download all PDFs (.zip)",
+        data=zip_bytes,
+        file_name=f"reports_{patient_id}.zip",
+        mime="application/zip",
+        key="download_all_pdfs"
+    )
+
+
+def report_editor(audience, patient_name, date_of_birth, patient_id):
+    """Editable sections of one report, its save button and PDF download."""
+    report = st.session_state[f"{audience}_report"]
+    values = {
+        name: st.text_area(
+            label,
+            value=getattr(report, name),
+            height=100,
+            key=f"{audience}_{name}_{st.session_state.report_version}"
+        )
+        for name, label in REPORT_FIELD_LABELS.items()
+    }
+    if report.missing_fields:
+        st.caption(f"⚠️ Not found in the generated report: {', '.join(REPORT_FIELD_LABELS[name] for name in report.missing_fields)}")
+
+    if st.button(f"Save {audience.title()} Report", type="primary", key=f"save_{audience}"):
+        store_report(st.session_state.report_language, audience, Report(**values), reset_editors=False)
+        st.success(f"{audience.title()} report saved successfully")
+
+    # PDF is rendered in the background and cached until the report content changes
+    pdf_download_section(audience.title(), st.session_state[f"{audience}_report"], st.session_state.report_language, patient_name, date_of_birth, patient_id)
+
+
+# === Two-pass Draft/Final Transcription ===
+@profiled
+def transcribe_two_pass(file_bytes, filename, content_type, s3_key, language, token):
+    """Start draft and accurate jobs on one upload and show the draft (with its reports) as soon as it is ready.
+
+    The accurate transcript and reports are produced in the background; final_pass_panel swaps them in.
+    Returns True once the draft is in the session.
+    """
+    try:
+        if not s3_key:
+            s3_key = upload_audio(file_bytes, filename, token, content_type)
+        draft_job = start_transcription(s3_key, language, token, quality="draft")
+        final_job = start_transcription(s3_key, language, token, quality="accurate")
+    except OFFLINE_ERRORS:
+        queue_audio_offline(file_bytes, filename, language, content_type)
+        return False
+    except ApiError as e:
+        st.error(f"❌ {e}")
+        return False
+
+    st.session_state.current_job_name = final_job
+    # The accurate job is the one worth resuming if the connection drops while waiting
+    segments = poll_transcription_status(draft_job, token, resume_job=final_job)
+    if not segments:
+        st.error("❌ Failed to retrieve the draft transcription.")
+        return False
+    set_transcript_segments(segments)
+    draft_text = st.session_state.current_transcript
+
+    reports = generate_reports_fanout(draft_text, token, [language])
+    if reports:
+        st.session_state.reports_by_language = reports
+        show_report_language(language)
+
+    st.session_state.final_pass = {
+        "future": get_final_pass_executor().submit(run_final_pass, final_job, token, list(reports) or [language]),
+        "draft_text": draft_text,
+        "draft_reports": reports
+    }
+    return True
+
+
+@st.cache_resource
+def get_final_pass_executor():
+    # Final passes mostly wait minutes on the accurate job, so they stay off the pipeline pool
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="final-pass")
+
+
+def run_final_pass(job_name, token, languages):
+    """Background: wait for the accurate transcript and summarize it in the draft's languages."""
+    segments = wait_for_transcription(job_name, token)
+    transcript = segments_to_text(segments)
+    reports = {
+        language: {audience: fetch_summary(f"summary-{audience}", transcript, token, language) for audience in REPORT_AUDIENCES}
+        for language in languages
+    }
+    return segments, reports
+
+
+def text_diff(before, after, name):
+    return "\n".join(difflib.unified_diff(before.splitlines(), after.splitlines(), f"draft {name}", f"final {name}", lineterm=""))
+
+
+def live_report(language, audience):
+    """The report as it stands in the editors, including edits the doctor has not saved yet."""
+    report = st.session_state.reports_by_language.get(language, {}).get(audience)
+    if report is None or language != st.session_state.report_language:
+        return report
+    version = st.session_state.report_version
+    return Report(**{
+        name: st.session_state.get(f"{audience}_{name}_{version}", getattr(report, name))
+        for name in REPORT_FIELDS
+    })
+
+
+def apply_final_pass():
+    """Replace the draft with the accurate results, keeping anything the doctor edited by hand."""
+    final_pass = st.session_state.final_pass
+    st.session_state.final_pass = None
+    try:
+        segments, final_reports = final_pass["future"].result()
+    except (ApiError, ValueError, *OFFLINE_ERRORS) as e:
+        st.session_state.final_pass_result = {"error": str(e)}
+        return
+
+    draft_text = final_pass["draft_text"]
+    final_text = segments_to_text(segments)
+    transcript_edited = st.session_state.current_transcript != draft_text
+    if not transcript_edited:
+        set_transcript_segments(segments)
+
+    diffs, kept = [], []
+    if final_text != draft_text:
+        diffs.append(text_diff(draft_text, final_text, "transcript"))
+    for language, reports in final_reports.items():
+        for audience, final_report in reports.items():
+            draft_report = final_pass["draft_reports"].get(language, {}).get(audience)
+            current = live_report(language, audience)
+            values = {}
+            for name in REPORT_FIELDS:
+                final_value = getattr(final_report, name)
+                if draft_report is not None and current is not None and getattr(current, name) != getattr(draft_report, name):
+                    values[name] = getattr(current, name)
+                    kept.append(f"{audience} report ({language}): {REPORT_FIELD_LABELS[name]}")
+                else:
+                    values[name] = final_value
+                if draft_report is not None and getattr(draft_report, name) != final_value:
+                    diffs.append(text_diff(getattr(draft_report, name), final_value, f"{audience}/{language}/{name}"))
+            st.session_state.reports_by_language.setdefault(language, {})[audience] = Report(**values)
+
+    show_report_language(st.session_state.report_language if st.session_state.report_language in final_reports else next(iter(final_reports)))
+    st.session_state.final_pass_result = {
+        "diff": "\n\n".join(diffs),
+        "kept": kept,
+        "final_segments": segments if transcript_edited else None
+    }
+
+
+def _final_pass_poll():
+    final_pass = st.session_state.final_pass
+    if final_pass is None:
+        return
+    if not final_pass["future"].done():
+        st.info("🔄 You are reviewing the draft. The accurate transcript and reports are still being prepared...")
+        return
+    apply_final_pass()
+    st.rerun()
+
+
+def final_pass_panel():
+    """Waits for the accurate pass, then shows what changed compared with the draft."""
+    if st.session_state.final_pass is not None:
+        st.fragment(_final_pass_poll, run_every=VISIT_REFRESH_SECONDS)()
+
+    result = st.session_state.final_pass_result
+    if not result:
+        return
+    if "error" in result:
+        st.warning(f"⚠️ The accurate pass failed, the draft is kept: {result['error']}")
+        return
+
+    with st.expander("🔍 Changes from the draft", expanded=True):
+        if result["diff"]:
+            st.code(result["diff"], language="diff")
+        else:
+            st.write("The accurate pass matched the draft.")
+        if result["kept"]:
+            st.caption("Kept your edits in: " + "; ".join(result["kept"]))
+        if result["final_segments"] is not None:
+            st.caption("Your transcript edits were kept.")
+            if st.button("Use accurate transcript instead", key="use_final_transcript"):
+                set_transcript_segments(result["final_segments"])
+                result["final_segments"] = None
+                st.rerun()
+        if st.button("Dismiss", key="dismiss_final_pass"):
+            st.session_state.final_pass_result = None
+            st.rerun()
+
+
 # === Patient Visit Tab (Enhanced) ===
+@profiled
 def patient_visit_tab():
     # Add custom CSS for better styling
     st.markdown("""
@@ -405,12 +2203,12 @@ def patient_visit_tab():
     with col1:
         st.markdown("#### 🎤 Record Audio")
         record_disabled = st.session_state.audio_source == "upload"
-        recorded_audio = st.audio_input("Record your visit notes", disabled=record_disabled)
+        recorded_audio = st.audio_input("Record your visit notes", disabled=record_disabled, key=f"audio_input_{st.session_state.audio_widget_version}")
 
     with col2:
         st.markdown("#### 📁 Upload Audio")
         upload_disabled = st.session_state.audio_source == "record"
-        uploaded_file = st.file_uploader("Upload audio file (MP3/WAV/M4A)", type=["mp3", "wav", "m4a"], disabled=upload_disabled)
+        uploaded_file = st.file_uploader("Upload audio file (MP3/WAV/M4A)", type=["mp3", "wav", "m4a"], disabled=upload_disabled, key=f"audio_upload_{st.session_state.audio_widget_version}")
 
     if recorded_audio and st.session_state.audio_source != "record":
         st.session_state.audio_source = "record"
@@ -420,234 +2218,187 @@ def patient_visit_tab():
         st.session_state.audio_source = "upload"
         st.rerun()
 
+    audio = selected_audio(recorded_audio, uploaded_file)
+    split_audio = st.checkbox("✂️ Split long recordings into parallel transcription jobs", value=SPLIT_LONG_AUDIO)
+    two_pass = st.checkbox(
+        "⚡ Show a quick draft first, then the accurate transcript",
+        value=TWO_PASS_TRANSCRIPTION,
+        help="Recordings that are split into parts skip the draft pass"
+    )
+    plan = plan_audio_chunks(audio, split_audio) if audio else None
+
+    # Upload in the background while the doctor picks the language and fills in patient details
+    update_speculative_upload(plan)
+    if plan is not None and plan["chunks"] is None:
+        st.fragment(_audio_plan_poll, run_every=1)()
+
     # Language selection with better styling
     st.markdown("#### 🌐 Select Language")
-    language = st.selectbox("Choose the language for transcription", ["en", "it"])
+    language = st.selectbox("Choose the language for transcription", ["en", "it"], key="language_select")
 
     # Transcription button with better styling
     if st.button("🎯 Generate Transcript", type="primary"):
         if not recorded_audio and not uploaded_file:
             st.error("❌ Please record or upload an audio file.")
         else:
+            st.session_state.visit_id = f"{patient_id or 'visit'}-{time.strftime('%Y%m%d-%H%M%S')}"
+            st.session_state.final_pass = None
+            st.session_state.final_pass_result = None
             with st.spinner("⏳ Uploading and starting transcription..."):
-                if recorded_audio:
-                    filename = "recorded-visit.wav"
-                    file_bytes = recorded_audio.getvalue()
-                    content_type = "audio/wav"
-                else:
-                    filename = uploaded_file.name
-                    file_bytes = uploaded_file.getvalue()
-                    content_type = f"audio/{uploaded_file.type}"
-
-                job_name = send_audio_to_transcription_api(file_bytes, filename, language, st.session_state.jwt_token, content_type)
+                resolve_audio_plan(plan, wait=True)
+                filename, file_bytes, content_type = plan_audio(audio, plan)
+                s3_keys = take_speculative_upload(plan)
 
-                if job_name:
-                    st.success(f"✅ Transcription started!")
-                    transcript = poll_transcription_status(job_name, st.session_state.jwt_token)
-                    if transcript:
+                if two_pass and len(plan["chunks"]) == 1:
+                    if transcribe_two_pass(file_bytes, filename, content_type, s3_keys[0], language, st.session_state.jwt_token):
+                        st.success("✅ Draft ready! The accurate version will replace it when it finishes.")
+                        st.rerun()
+                elif len(plan["chunks"]) > 1:
+                    try:
+                        result = transcribe_chunks_in_parallel(plan["chunks"], s3_keys, language, st.session_state.jwt_token)
+                    except OFFLINE_ERRORS:
+                        queue_audio_offline(file_bytes, filename, language, content_type)
+                        result = None
+                    if result:
+                        job_names, segments = result
+                        st.session_state.current_job_name = ",".join(job_names)
                         st.success("✅ Transcription Completed!")
-                        st.session_state.current_transcript = transcript
+                        set_transcript_segments(segments)
                         st.rerun()
-                    else:
-                        st.error("❌ Failed to retrieve transcription result.")
+                else:
+                    job_name = send_audio_to_transcription_api(file_bytes, filename, language, st.session_state.jwt_token, content_type, s3_key=s3_keys[0])
+
+                    if job_name:
+                        st.session_state.current_job_name = job_name
+                        st.success(f"✅ Transcription started!")
+                        segments = poll_transcription_status(job_name, st.session_state.jwt_token)
+                        if segments:
+                            st.success("✅ Transcription Completed!")
+                            set_transcript_segments(segments)
+                            st.rerun()
+                        else:
+                            st.error("❌ Failed to retrieve transcription result.")
+
+    if st.button("🗂️ Add to Visit Queue", help="Transcribe and summarize in the background while you start the next visit"):
+        if not audio:
+            st.error("❌ Please record or upload an audio file.")
+        else:
+            resolve_audio_plan(plan, wait=True)
+            queue_visit(plan_audio(audio, plan), plan, language, {
+                "name": patient_name,
+                "birth_date": date_of_birth.strftime("%Y-%m-%d"),
+                "med_number": patient_id
+            })
+            st.rerun()
+
+    outbox_status_panel()
+    visit_queue_dashboard()
+    final_pass_panel()
 
     # Display transcript and generate reports button only if transcript is available
     if 'current_transcript' in st.session_state and st.session_state.current_transcript:
         st.markdown("### 📝 Transcript")
         st.markdown("Review and edit the transcript if needed:")
-        edited_transcript = st.text_area(
-            "Transcript content",
-            value=st.session_state.current_transcript,
-            height=400,
-            key="transcript_editor"
-        )
-        
-        if edited_transcript != st.session_state.current_transcript:
-            st.session_state.current_transcript = edited_transcript
+        transcript_editor()
         
+        report_languages = st.multiselect(
+            "Report languages",
+            list(PDF_LOCALES),
+            default=[language] if language in PDF_LOCALES else ["en"],
+            help="All selected languages and both reports are generated at the same time"
+        )
+
         if st.button("📊 Generate Reports", type="primary"):
-            with st.spinner("⏳ Generating reports..."):
-                doctor_report = generate_doctor_report(st.session_state.current_transcript, st.session_state.jwt_token, language)
-                patient_report = generate_patient_report(st.session_state.current_transcript, st.session_state.jwt_token, language)
-                if patient_report and doctor_report:
-                    st.session_state.patient_report = patient_report
-                    st.session_state.doctor_report = doctor_report
-                    st.success("✅ Reports Generated Successfully!")
-                    st.rerun()
+            if not report_languages:
+                st.error("❌ Please select at least one report language.")
+            else:
+                with st.spinner("⏳ Generating reports..."):
+                    results = generate_reports_fanout(st.session_state.current_transcript, st.session_state.jwt_token, report_languages)
+                    if results:
+                        st.session_state.reports_by_language = results
+                        show_report_language(language if language in results else next(iter(results)))
+                        st.success("✅ Reports Generated Successfully!")
+                        st.rerun()
 
     # Display report data in editable fields if available
     if st.session_state.patient_report and st.session_state.doctor_report:
         st.markdown("### 📋 Report Summary")
         st.markdown("Review and edit the report details below:")
+        generated_languages = list(st.session_state.reports_by_language)
+        if len(generated_languages) > 1:
+            review_language = st.radio(
+                "Review language",
+                generated_languages,
+                index=generated_languages.index(st.session_state.report_language),
+                horizontal=True
+            )
+            if review_language != st.session_state.report_language:
+                keep_live_edits()
+                show_report_language(review_language)
+                st.rerun()
         st.markdown("---")
 
         report_tab1, report_tab2 = st.tabs(["🏥 Patient Report", "👨‍⚕️ Doctor Report"])
         
         with report_tab1:
-            # Patient Report
-            patient_report = st.session_state.patient_report
-            
-            reason_for_visit = st.text_area(
-                "Reason for Visit",
-                value=patient_report.get("reason_for_visit", ""),
-                height=100,
-                key="patient_reason_visit"
-            )
-            
-            chief_complaint = st.text_area(
-                "Chief Complaint History",
-                value=patient_report.get("chief_complaint_history", ""),
-                height=100,
-                key="patient_chief_complaint"
-            )
-            
-            clinical_findings = st.text_area(
-                "Clinical Findings",
-                value=patient_report.get("clinical_findings", ""),
-                height=100,
-                key="patient_clinical_findings"
-            )
-            
-            diagnosis_plan = st.text_area(
-                "Diagnosis & Treatment Plan",
-                value=patient_report.get("diagnosis_treatment_plan", ""),
-                height=100,
-                key="patient_diagnosis_plan"
-            )
-            
-            medication = st.text_area(
-                "Medication & Prescription",
-                value=patient_report.get("medication_prescription", ""),
-                height=100,
-                key="patient_medication"
-            )
-            
-            follow_up = st.text_area(
-                "Follow-up Recommendations",
-                value=patient_report.get("follow_up_recommendations", ""),
-                height=100,
-                key="patient_follow_up"
-            )
-
-            if st.button("Save Patient Report", type="primary", key="save_patient"):
-                updated_report = {
-                    "reason_for_visit": reason_for_visit,
-                    "chief_complaint_history": chief_complaint,
-                    "clinical_findings": clinical_findings,
-                    "diagnosis_treatment_plan": diagnosis_plan,
-                    "medication_prescription": medication,
-                    "follow_up_recommendations": follow_up
-                }
-                st.session_state.patient_report = updated_report
-                st.success("Patient report saved successfully")
-            
-            # Add PDF generation button for patient report
-            if st.button("Generate PDF", type="secondary", key="gen_patient_pdf"):
-                info = {
-                    "doctor_name": st.session_state.doctor_settings["doctor_name"],
-                    "specialization": st.session_state.doctor_settings["specialization"],
-                    "contact": st.session_state.doctor_settings["contact"],
-                    "email": st.session_state.doctor_settings["email"],
-                    "visit_date": time.strftime("%Y-%m-%d"),
-                    "type_report": "Patient",
-                    "logo_path": "logo.png",
-                    "patient": {
-                        "name": patient_name,
-                        "birth_date": date_of_birth.strftime("%Y-%m-%d"),
-                        "med_number": patient_id
-                    }
-                }
-                pdf_buffer = generate_pdf(info, st.session_state.patient_report,language)
-                st.download_button(
-                    label="Download PDF",
-                    data=pdf_buffer,
-                    file_name=f"patient_report_{patient_id}.pdf",
-                    mime="application/pdf"
-                )
+            report_editor("patient", patient_name, date_of_birth, patient_id)
 
         with report_tab2:
-            # Doctor Report
-            doctor_report = st.session_state.doctor_report
-            
-            reason_for_visit = st.text_area(
-                "Reason for Visit",
-                value=doctor_report.get("reason_for_visit", ""),
-                height=100,
-                key="doctor_reason_visit"
-            )
-            
-            chief_complaint = st.text_area(
-                "Chief Complaint History",
-                value=doctor_report.get("chief_complaint_history", ""),
-                height=100,
-                key="doctor_chief_complaint"
-            )
-            
-            clinical_findings = st.text_area(
-                "Clinical Findings",
-                value=doctor_report.get("clinical_findings", ""),
-                height=100,
-                key="doctor_clinical_findings"
-            )
-            
-            diagnosis_plan = st.text_area(
-                "Diagnosis & Treatment Plan",
-                value=doctor_report.get("diagnosis_treatment_plan", ""),
-                height=100,
-                key="doctor_diagnosis_plan"
-            )
-            
-            medication = st.text_area(
-                "Medication & Prescription",
-                value=doctor_report.get("medication_prescription", ""),
-                height=100,
-                key="doctor_medication"
-            )
-            
-            follow_up = st.text_area(
-                "Follow-up Recommendations",
-                value=doctor_report.get("follow_up_recommendations", ""),
-                height=100,
-                key="doctor_follow_up"
-            )
+            report_editor("doctor", patient_name, date_of_birth, patient_id)
+
+        batch_pdf_section(patient_name, date_of_birth, patient_id)
+
+# === Profiler Page (admin only) ===
+def profiler_page():
+    st.markdown("<h1 class='app-title'>Rerun Profiler</h1>", unsafe_allow_html=True)
+    if not profiling_enabled():
+        st.info("Profiling is off. Set PROFILE_RERUNS in secrets or open the app with ?profile=1.")
+
+    profiles = get_profile_store().slowest()
+    if not profiles:
+        st.write("No reruns recorded yet.")
+        return
+
+    st.markdown("#### 🐢 Slowest reruns")
+    st.dataframe([
+        {
+            "started": time.strftime("%H:%M:%S", time.localtime(profile.started)),
+            "page": profile.page,
+            "total_ms": round(profile.total * 1000, 1),
+            "cut short by st.rerun": profile.interrupted,
+            "slowest section": max(profile.sections, key=lambda section: section[1])[0] if profile.sections else ""
+        }
+        for profile in profiles
+    ], use_container_width=True)
+
+    index = st.selectbox(
+        "Inspect rerun",
+        range(len(profiles)),
+        format_func=lambda i: f"#{i + 1} · {profiles[i].page} · {profiles[i].total * 1000:.0f} ms"
+    )
+    profile = profiles[index]
+
+    st.markdown("#### ⏱️ Sections and functions")
+    st.dataframe([
+        {"name": ("  " * depth) + name, "level": "section" if depth == 0 else "function", "ms": round(seconds * 1000, 1)}
+        for name, seconds, depth in profile.sections
+    ], use_container_width=True)
+
+    st.markdown("#### 🔥 Sampled stacks")
+    folded = "\n".join(f"{stack} {count}" for stack, count in profile.stacks.most_common())
+    st.caption(f"{sum(profile.stacks.values())} samples every {PROFILE_SAMPLE_INTERVAL * 1000:.0f} ms, in folded format for flamegraph.pl or speedscope.")
+    st.dataframe([
+        {"samples": count, "leaf": stack.rsplit(";", 1)[-1], "stack": stack}
+        for stack, count in profile.stacks.most_common(25)
+    ], use_container_width=True)
+    st.download_button("Download folded stacks", data=folded, file_name="rerun.folded", mime="text/plain")
+
+    st.markdown("#### 🧮 Allocations")
+    st.dataframe(profile.allocations, use_container_width=True)
 
-            if st.button("Save Doctor Report", type="primary", key="save_doctor"):
-                updated_report = {
-                    "reason_for_visit": reason_for_visit,
-                    "chief_complaint_history": chief_complaint,
-                    "clinical_findings": clinical_findings,
-                    "diagnosis_treatment_plan": diagnosis_plan,
-                    "medication_prescription": medication,
-                    "follow_up_recommendations": follow_up
-                }
-                st.session_state.doctor_report = updated_report
-                st.success("Doctor report saved successfully")
-            
-            # Add PDF generation button for doctor report
-            if st.button("Generate PDF", type="secondary", key="gen_doctor_pdf"):
-                info = {
-                    "doctor_name": st.session_state.doctor_settings["doctor_name"],
-                    "specialization": st.session_state.doctor_settings["specialization"],
-                    "contact": st.session_state.doctor_settings["contact"],
-                    "email": st.session_state.doctor_settings["email"],
-                    "visit_date": time.strftime("%Y-%m-%d"),
-                    "type_report": "Doctor",
-                    "logo_path": "logo.png",
-                    "patient": {
-                        "name": patient_name,
-                        "birth_date": date_of_birth.strftime("%Y-%m-%d"),
-                        "med_number": patient_id
-                    }
-                }
-                pdf_buffer = generate_pdf(info, st.session_state.doctor_report,language)
-                st.download_button(
-                    label="Download PDF",
-                    data=pdf_buffer,
-                    file_name=f"doctor_report_{patient_id}.pdf",
-                    mime="application/pdf"
-                )
 
 # === Session Setup ===
+profile_mark("session_setup")
 if 'jwt_token' not in st.session_state:
     st.session_state.jwt_token = None
 if 'pre_briefing_data' not in st.session_state:
@@ -660,6 +2411,40 @@ if 'doctor_report' not in st.session_state:
     st.session_state.doctor_report = None
 if 'current_transcript' not in st.session_state:
     st.session_state.current_transcript = None
+if 'transcript_segments' not in st.session_state:
+    st.session_state.transcript_segments = []
+if 'transcript_version' not in st.session_state:
+    st.session_state.transcript_version = 0
+if 'transcript_page' not in st.session_state:
+    st.session_state.transcript_page = 0
+if 'reports_by_language' not in st.session_state:
+    st.session_state.reports_by_language = {}
+if 'report_language' not in st.session_state:
+    st.session_state.report_language = "en"
+if 'report_version' not in st.session_state:
+    st.session_state.report_version = 0
+if 'final_pass' not in st.session_state:
+    st.session_state.final_pass = None
+if 'final_pass_result' not in st.session_state:
+    st.session_state.final_pass_result = None
+if 'audio_widget_version' not in st.session_state:
+    st.session_state.audio_widget_version = 0
+if 'visit_queue_polling' not in st.session_state:
+    st.session_state.visit_queue_polling = False
+if 'audio_plan' not in st.session_state:
+    st.session_state.audio_plan = None
+if 'speculative_upload' not in st.session_state:
+    st.session_state.speculative_upload = None
+if 'visit_id' not in st.session_state:
+    st.session_state.visit_id = None
+if 'current_job_name' not in st.session_state:
+    st.session_state.current_job_name = None
+if 'transcript_refs' not in st.session_state:
+    st.session_state.transcript_refs = {}
+if 'pdf_jobs' not in st.session_state:
+    st.session_state.pdf_jobs = {}
+if 'pdf_failures' not in st.session_state:
+    st.session_state.pdf_failures = {}
 if 'doctor_settings' not in st.session_state:
     st.session_state.doctor_settings = {
         "doctor_name": "Dr. Naheed Khan",
@@ -672,6 +2457,7 @@ if 'current_page' not in st.session_state:
 
 # === Login Screen (if not logged in) ===
 if st.session_state.jwt_token is None:
+    profile_mark("login_page")
     st.markdown("""
         <style>
         /* Reset default theme */
@@ -737,11 +2523,13 @@ if st.session_state.jwt_token is None:
                     token = login_to_cognito(email, password)
                     if token:
                         st.session_state.jwt_token = token
+                        get_pipeline_executor().submit(prewarm_connections)
                         st.success("✅ Logged in successfully!")
                         st.rerun()
 
 # === Home Page (after login) ===
 else:
+    profile_mark("home_css")
     st.markdown("""
         <style>
         /* Reset default theme */
@@ -870,6 +2658,7 @@ else:
     """, unsafe_allow_html=True)
 
     # Navigation bar
+    profile_mark("navigation")
     nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
     
     with nav_col2:
@@ -879,19 +2668,23 @@ else:
         if st.button("Doctor's credentials", key="stButtonSettings_nav", help="Settings"):
             st.session_state.current_page = "settings"
             st.rerun()
+        if is_admin(st.session_state.jwt_token) and st.button("Profiler", key="stButtonProfiler_nav", help="Rerun profiler"):
+            st.session_state.current_page = "profiler"
+            st.rerun()
 
     st.markdown("<hr style='margin: 1rem 0; border-color: #404040;'>", unsafe_allow_html=True)
 
+    profile_mark(f"{st.session_state.current_page}_page")
     if st.session_state.current_page == "home":
         # Patient Info Inputs in columns
         col1, col2, col3 = st.columns([1, 1, 1])
         
         with col1:
-            patient_id = st.text_input("Patient ID", placeholder="Enter patient ID")
+            patient_id = st.text_input("Patient ID", placeholder="Enter patient ID", key="patient_id_input")
         with col2:
-            patient_name = st.text_input("Patient Name", placeholder="Enter patient name")
+            patient_name = st.text_input("Patient Name", placeholder="Enter patient name", key="patient_name_input")
         with col3:
-            date_of_birth = st.date_input("Date of Birth")
+            date_of_birth = st.date_input("Date of Birth", key="date_of_birth_input")
 
         patient_visit_tab()
 
@@ -944,3 +2737,13 @@ else:
                 st.success("✅ Settings saved successfully!")
                 st.session_state.current_page = "home"
                 st.rerun()
+
+    elif st.session_state.current_page == "profiler":
+        if is_admin(st.session_state.jwt_token):
+            profiler_page()
+        else:
+            st.session_state.current_page = "home"
+            st.rerun()
+
+if PROFILER is not None:
+    PROFILER.finish()
@@ -0,0 +1,174 @@
+import ast
+import json
+from dataclasses import dataclass
+
+try:
+    # Optional: faster JSON parsing of summary responses
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# === Report Model ===
+REPORT_FIELDS = (
+    "reason_for_visit",
+    "chief_complaint_history",
+    "clinical_findings",
+    "diagnosis_treatment_plan",
+    "medication_prescription",
+    "follow_up_recommendations"
+)
+
+REPORT_FIELD_LABELS = {
+    "reason_for_visit": "Reason for Visit",
+    "chief_complaint_history": "Chief Complaint History",
+    "clinical_findings": "Clinical Findings",
+    "diagnosis_treatment_plan": "Diagnosis & Treatment Plan",
+    "medication_prescription": "Medication & Prescription",
+    "follow_up_recommendations": "Follow-up Recommendations"
+}
+
+
+@dataclass
+class Report:
+    """The six report sections, shared by the editors, the session store and the PDF renderer."""
+    __slots__ = REPORT_FIELDS
+    reason_for_visit: str
+    chief_complaint_history: str
+    clinical_findings: str
+    diagnosis_treatment_plan: str
+    medication_prescription: str
+    follow_up_recommendations: str
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a report from LLM output, filling missing sections and flattening non-text values."""
+        if not isinstance(data, dict):
+            raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+        values = {}
+        for name in REPORT_FIELDS:
+            value = data.get(name)
+            if value is None:
+                value = ""
+            elif isinstance(value, list):
+                value = "\n".join(str(item) for item in value)
+            elif not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False) if isinstance(value, dict) else str(value)
+            values[name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in REPORT_FIELDS}
+
+    @property
+    def missing_fields(self):
+        return [name for name in REPORT_FIELDS if not getattr(self, name)]
+
+
+def loads_json(data):
+    """Parse JSON with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _close_json(text, drop_last=False):
+    """Close a (possibly truncated) JSON object, dropping trailing commas outside strings
+    and escaping control characters inside them.
+
+    A top-level member cut off mid-value is dropped rather than closed, so a truncated
+    section shows up as missing instead of as shortened text; `drop_last` also drops a
+    last member that merely looks complete.
+    """
+    out, closers, quote, escape = [], [], None, False
+    member_start = 1
+    for ch in text:
+        if quote:
+            if ch < " ":
+                # Raw newlines and tabs inside strings are escaped rather than rejected
+                ch = CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}")
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                quote = None
+            continue
+        if ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(ch)
+            if closers:
+                closers.pop()
+            if not closers:
+                # Top-level object finished; ignore any trailing chatter
+                return "".join(out)
+            continue
+        if ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch == "," and len(closers) == 1:
+            member_start = len(out)
+        out.append(ch)
+
+    text = "".join(out).rstrip()
+    complete = not quote and len(closers) == 1 and text.endswith(("\"", "'", "}", "]"))
+    if drop_last or not complete:
+        text = text[:member_start]
+    return text.rstrip(", \t\r\n") + "}"
+
+
+def repair_json(text):
+    """Recover a dict from almost-valid LLM JSON: code fences, prose around the object,
+    trailing commas, Python-style quoting and truncated output. Raises ValueError if nothing parses."""
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("no JSON object found")
+
+    for drop_last in (False, True):
+        closed = _close_json(text[start:], drop_last)
+        try:
+            return loads_json(closed)
+        except ValueError:
+            pass
+        try:
+            # Single-quoted keys/strings are valid Python literals
+            value = ast.literal_eval(closed)
+            if isinstance(value, dict):
+                return value
+        except (ValueError, SyntaxError):
+            pass
+    raise ValueError("JSON could not be repaired")
+
+
+def clean_llm_response(llm_response):
+    """Extracts and parses the actual response from the LLM, converting it into a clean Python dictionary."""
+    if not isinstance(llm_response, dict):
+        raise ValueError(f"expected a JSON object, got {type(llm_response).__name__}")
+
+    # Extract the inner response, which is usually a JSON string but may already be an object
+    response_str = llm_response.get('response', '')
+    if isinstance(response_str, dict):
+        return response_str
+    if not isinstance(response_str, str):
+        raise ValueError(f"expected the response as a JSON string, got {type(response_str).__name__}")
+
+    try:
+        # Convert the string into a proper dictionary
+        report = loads_json(response_str)
+    except ValueError as e:
+        # Nearly valid output is repaired instead of paying for another summary call
+        try:
+            return repair_json(response_str)
+        except ValueError:
+            raise ValueError(f"Failed to parse LLM response: {e}")
+    if not isinstance(report, dict):
+        raise ValueError(f"expected the response to hold a JSON object, got {type(report).__name__}")
+    return report
@@ -0,0 +1,82 @@
+import pytest
+
+from report_model import Report, clean_llm_response, repair_json
+
+
+def test_repair_strips_code_fences_and_prose():
+    text = 'Here is the report:\n```json\n{"reason_for_visit": "Cough"}\n```\nLet me know!'
+    assert repair_json(text) == {"reason_for_visit": "Cough"}
+
+
+def test_repair_strips_trailing_commas():
+    assert repair_json('{"reason_for_visit": "Cough", "clinical_findings": ["a", "b",],}') == {
+        "reason_for_visit": "Cough",
+        "clinical_findings": ["a", "b"]
+    }
+
+
+def test_repair_keeps_commas_inside_strings():
+    assert repair_json('{"reason_for_visit": "a, }", "clinical_findings": "b",}') == {
+        "reason_for_visit": "a, }",
+        "clinical_findings": "b"
+    }
+
+
+def test_repair_escapes_raw_newlines_in_strings():
+    response = {"response": '{"reason_for_visit": "Cough", "clinical_findings": "Line one\nLine two\tend"}'}
+    assert clean_llm_response(response) == {
+        "reason_for_visit": "Cough",
+        "clinical_findings": "Line one\nLine two\tend"
+    }
+
+
+def test_repair_accepts_python_quoting():
+    assert repair_json("{'reason_for_visit': 'Cough, fever',}") == {"reason_for_visit": "Cough, fever"}
+
+
+def test_repair_drops_field_truncated_mid_string():
+    repaired = repair_json('{"reason_for_visit": "Cough", "medication_prescription": "Aspirin 10')
+    assert repaired == {"reason_for_visit": "Cough"}
+
+
+def test_repair_drops_field_truncated_mid_list():
+    repaired = repair_json('{"reason_for_visit": "Cough", "clinical_findings": ["a", "b"')
+    assert repaired == {"reason_for_visit": "Cough"}
+
+
+def test_repair_drops_key_without_value():
+    assert repair_json('{"reason_for_visit": "Cough", "clinical_findings":') == {"reason_for_visit": "Cough"}
+    assert repair_json('{"reason_for_visit": "Cough", "clinical_findings"') == {"reason_for_visit": "Cough"}
+
+
+def test_repair_keeps_complete_last_field_when_only_brace_is_missing():
+    assert repair_json('{"reason_for_visit": "Cough", "clinical_findings": "Clear lungs"') == {
+        "reason_for_visit": "Cough",
+        "clinical_findings": "Clear lungs"
+    }
+
+
+def test_repair_truncated_first_field_gives_empty_report():
+    assert repair_json('{"reason_for_visit": "Cou') == {}
+
+
+def test_repair_without_object_raises():
+    with pytest.raises(ValueError):
+        repair_json("I could not summarize this visit.")
+
+
+def test_truncated_field_is_reported_missing():
+    report = Report.from_dict(clean_llm_response({"response": '{"reason_for_visit": "Cough", "medication_prescription": "Aspirin 10'}))
+    assert report.reason_for_visit == "Cough"
+    assert "medication_prescription" in report.missing_fields
+
+
+@pytest.mark.parametrize("body", [{"response": "[1, 2]"}, {"response": '"x"'}, {"response": 3}, ["x"], "x"])
+def test_non_object_responses_raise_value_error(body):
+    with pytest.raises(ValueError):
+        Report.from_dict(clean_llm_response(body))
+
+
+def test_from_dict_rejects_non_object():
+    with pytest.raises(ValueError):
+        Report.from_dict([1, 2])